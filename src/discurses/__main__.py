@@ -1,11 +1,83 @@
-from . import discord
+"""The discurses command line entry point."""
+import argparse
+import json
+
+from . import config, discord
 from . import log  # noqa
 
 
-def main():
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(prog='discurses')
+    parser.add_argument(
+        '--record', metavar='FILE',
+        help="record the gateway stream and REST responses to FILE")
+    parser.add_argument(
+        '--replay', metavar='FILE',
+        help="replay a recorded session offline with a headless UI")
+    parser.add_argument(
+        '--speed', default='1',
+        help="replay speed, a multiplier such as 1 or 10, or 'max'")
+    parser.add_argument(
+        '--api-base', metavar='URL',
+        help="use another API, such as a discurses.fakeserver")
+    parser.add_argument(
+        '--headless', action='store_true',
+        help="render the UI without a terminal")
+    parser.add_argument(
+        '--duration', type=float, metavar='SECONDS',
+        help="log out after SECONDS")
+    parser.add_argument(
+        '--stats', action='store_true',
+        help="print event-to-screen latency and memory stats on exit")
+    return parser.parse_args(args)
+
+
+def main(args=None):
     """Run discurses."""
-    client = discord.DiscordClient()
-    client.run()
+    args = parse_args(args)
+    if args.replay is not None:
+        from .replay import ReplayClient
+        speed = 0 if args.speed == 'max' else float(args.speed)
+        ReplayClient(args.replay, speed=speed).run()
+        return
+    if args.api_base is not None:
+        from discord.http import Route
+        Route.BASE = args.api_base.rstrip('/')
+    recorder = None
+    if args.record is not None:
+        from .replay import Recorder
+        recorder = Recorder(args.record)
+    screen = None
+    if args.headless:
+        from .ui.headless import HeadlessScreen
+        screen = HeadlessScreen()
+    tokens = config.table.get('tokens')
+    if tokens:
+        from .accounts import ClientGroup
+        client = ClientGroup(tokens, recorder=recorder, screen=screen)
+    else:
+        client = discord.DiscordClient(recorder=recorder, screen=screen)
+    probe = None
+    if args.stats:
+        from .perf import LatencyProbe
+        probe = LatencyProbe(client)
+        probe.attach(client.ui.urwid_loop.screen)
+    if args.duration is not None:
+        client.loop.call_later(args.duration,
+                               lambda: client.async_do(client.logout()))
+    try:
+        client.run()
+    finally:
+        # However the session ended, so that the next one starts warm
+        client.ui.save_snapshot()
+        client.media.close()
+        if recorder is not None:
+            recorder.close()
+        if probe is not None:
+            stats = probe.stats()
+            stats['output_bytes'] = client.ui.output.bytes
+            stats['draws'] = client.ui.output.draws
+            print(json.dumps(stats))
 
 if __name__ == '__main__':
-    discurses.main()
+    main()
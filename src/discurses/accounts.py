@@ -0,0 +1,148 @@
+"""Several accounts in one process."""
+import asyncio
+
+from discurses.discord import EVENTS, DiscordClient, start_services
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ClientGroup:
+    """
+    The accounts of the `tokens`, logged in at once on one event loop.
+
+    The UI, the caches of avatars, media and messages, the unread index
+    and the background tasks are shared by the accounts, and the group
+    stands in for a DiscordClient to them: its servers and private
+    channels are those of every account, so a tab can mix channels of
+    several, and requests about a channel are made by the account it
+    belongs to. Servers several accounts are in are shown as seen by the
+    first of them.
+
+    Only the first account is recorded with `recorder`, as a recording is
+    of one gateway session.
+    """
+
+    def __init__(self, tokens, screen=None, recorder=None, warm_start=True):
+        self.loop = asyncio.get_event_loop()
+        self.screen = screen
+        self.event_handlers = {event: [] for event in EVENTS}
+        # Channel id -> the client of its account, cleared on READY
+        self.channel_clients = {}
+        self.clients = [
+            DiscordClient(loop=self.loop, token=token, group=self,
+                          recorder=recorder if index == 0 else None)
+            for index, token in enumerate(tokens)]
+        start_services(self, warm_start)
+        for client in self.clients:
+            for name in DiscordClient.SHARED:
+                setattr(client, name, getattr(self, name))
+
+    @property
+    def http(self):
+        return self.clients[0].http
+
+    @property
+    def user(self):
+        """The user of the first account"""
+        return self.clients[0].user
+
+    @property
+    def received_ready(self):
+        return any(c.received_ready for c in self.clients)
+
+    @property
+    def all_ready(self):
+        return all(c.received_ready for c in self.clients)
+
+    @property
+    def servers(self):
+        servers = {}
+        for client in self.clients:
+            for server in client.servers:
+                servers.setdefault(server.id, server)
+        return list(servers.values())
+
+    @property
+    def private_channels(self):
+        return [ch for client in self.clients
+                for ch in client.private_channels]
+
+    def add_event_handler(self, event, f):
+        self.clients[0].add_event_handler(event, f)
+
+    def remove_event_handlers(self, owner):
+        self.clients[0].remove_event_handlers(owner)
+
+    def async_do(self, f, *args, **kwargs):
+        return self.clients[0].async_do(f, *args, **kwargs)
+
+    def client_for(self, channel):
+        """The client of the first account that can see `channel`"""
+        client = self.channel_clients.get(channel.id)
+        if client is None:
+            client = next((c for c in self.clients
+                           if c.get_channel(channel.id) is not None), None)
+            if client is None:
+                return self.clients[0]
+            self.channel_clients[channel.id] = client
+        return client
+
+    def client_for_server(self, server):
+        """The client of the first account that is in `server`"""
+        return next((c for c in self.clients
+                     if c.get_server(server.id) is not None),
+                    self.clients[0])
+
+    def get_channel(self, id):
+        for client in self.clients:
+            channel = client.get_channel(id)
+            if channel is not None:
+                return channel
+        return None
+
+    # Requests about a channel, made by its account
+
+    def logs_from(self, channel, *args, **kwargs):
+        return self.client_for(channel).logs_from(channel, *args, **kwargs)
+
+    def get_logs_from(self, channel, *args, **kwargs):
+        return self.client_for(channel).get_logs_from(
+            channel, *args, **kwargs)
+
+    def send_message(self, channel, *args, **kwargs):
+        return self.client_for(channel).send_message(
+            channel, *args, **kwargs)
+
+    def send_file(self, channel, *args, **kwargs):
+        return self.client_for(channel).send_file(channel, *args, **kwargs)
+
+    def send_typing(self, channel):
+        return self.client_for(channel).send_typing(channel)
+
+    def edit_message(self, message, *args, **kwargs):
+        return self.client_for(message.channel).edit_message(
+            message, *args, **kwargs)
+
+    def delete_message(self, message):
+        return self.client_for(message.channel).delete_message(message)
+
+    def send_ack(self, message):
+        return self.client_for(message.channel).send_ack(message)
+
+    def get_avatar(self, user):
+        return self.clients[0].get_avatar(user)
+
+    async def logout(self):
+        await asyncio.gather(*(c.logout() for c in self.clients))
+
+    def run(self):
+        """Run every account until they are all logged out"""
+        try:
+            self.loop.run_until_complete(asyncio.gather(
+                *(c.start() for c in self.clients)))
+        except KeyboardInterrupt:
+            self.loop.run_until_complete(self.logout())
+        finally:
+            self.loop.close()
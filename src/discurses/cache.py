@@ -0,0 +1,160 @@
+"""On-disk caches."""
+import asyncio
+import collections
+import os
+import tempfile
+
+import aiohttp
+
+import discurses.config as config
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def write_atomic(path, data):
+    """Write `data` to `path`, so that `path` is never partially written"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class FileCache:
+    """
+    A directory of cached files with a size cap.
+
+    The files are indexed in memory in least recently used order. When they
+    take up more than `max_bytes`, the least recently used are deleted.
+    File I/O happens in the default executor, off the event loop.
+    """
+
+    def __init__(self, directory, max_bytes, loop):
+        self.directory = config.create_dir(directory)
+        self.max_bytes = max_bytes
+        self.loop = loop
+        self.index = collections.OrderedDict()
+        self.size = 0
+        self._load_index()
+
+    def _load_index(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith('.tmp'):
+                _unlink(entry.path)
+                continue
+            # Partial downloads, kept to be resumed, count against the cap
+            # like the rest
+            stat = entry.stat()
+            entries.append((stat.st_atime, entry.name, stat.st_size))
+        for _atime, name, size in sorted(entries):
+            self.index[name] = size
+            self.size += size
+        self._evict()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def get(self, name):
+        """The path of `name` if it is cached, marking it as used"""
+        if name not in self.index:
+            return None
+        self.index.move_to_end(name)
+        return self.path(name)
+
+    def add(self, name, size):
+        """Index a file that was written to `self.path(name)`"""
+        self.size += size - self.index.pop(name, 0)
+        self.index[name] = size
+        self._evict()
+
+    def forget(self, name):
+        """Stop indexing `name`, such as a file being written to"""
+        self.size -= self.index.pop(name, 0)
+
+    async def put(self, name, data):
+        """Store `data` as `name`"""
+        await self.loop.run_in_executor(None, write_atomic, self.path(name),
+                                        data)
+        self.add(name, len(data))
+        return self.path(name)
+
+    def _evict(self):
+        while self.size > self.max_bytes and len(self.index) > 1:
+            name, size = self.index.popitem(last=False)
+            self.size -= size
+            logger.debug("Evicting %s from %s", name, self.directory)
+            if self.loop.is_running():
+                self.loop.run_in_executor(None, _unlink, self.path(name))
+            else:
+                _unlink(self.path(name))
+
+
+class AvatarCache(FileCache):
+    """
+    Avatars of users, fetched once per avatar id.
+    Concurrent requests for the same avatar share one download.
+    """
+
+    def __init__(self, session, loop, directory=config.CACHE_AVATARS_PATH,
+                 max_bytes=None):
+        if max_bytes is None:
+            max_bytes = config.table.get('avatar_cache_size', 50) * 2 ** 20
+        super().__init__(directory, max_bytes, loop)
+        self.session = session
+        self._in_flight = {}
+
+    async def get_avatar(self, user):
+        """The path of the avatar of `user`, or `None` if it can't be had"""
+        avatar_id = user.avatar
+        if avatar_id is None:
+            avatar_id = user.default_avatar
+        name = "{0}.jpg".format(avatar_id)
+        path = self.get(name)
+        if path is not None:
+            return path
+        future = self._in_flight.get(name)
+        if future is None:
+            avatar_url = user.avatar_url
+            if avatar_url == "":
+                avatar_url = user.default_avatar_url
+            future = asyncio.ensure_future(self._fetch(name, avatar_url),
+                                           loop=self.loop)
+            self._in_flight[name] = future
+            future.add_done_callback(
+                lambda f: self._in_flight.pop(name, None))
+        # A cancelled waiter must not cancel the download for the others
+        return await asyncio.shield(future)
+
+    async def _fetch(self, name, url):
+        try:
+            response = await self.session.get(url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Could not fetch avatar %s: %r", url, e)
+            return None
+        try:
+            if response.status != 200:
+                logger.warning("Could not fetch avatar %s: HTTP %d",
+                               url, response.status)
+                return None
+            data = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Could not fetch avatar %s: %r", url, e)
+            return None
+        finally:
+            response.release()
+        return await self.put(name, data)
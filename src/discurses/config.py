@@ -8,6 +8,7 @@ CONFIG_FILE_PATH = os.path.join(
     os.path.expanduser("~"), ".config", "discurses.yaml")
 CACHE_DIR_PATH = os.path.join(os.path.expanduser("~"), ".cache", "discurses")
 CACHE_AVATARS_PATH = os.path.join(CACHE_DIR_PATH, "avatars")
+CACHE_MEDIA_PATH = os.path.join(CACHE_DIR_PATH, "media")
 
 PLATFORM = platform.system()
 
@@ -64,7 +65,7 @@ async def send_notification(discord, message):
     Send a system notification
     This will be called depending on the current notification settings
     """
-    avatar = await discord.get_avatar(message.author)
+    avatar = await discord.get_avatar(message.author) or ""
     nickname = message.author.display_name
     if PLATFORM == "Linux":
         linux_notify(message, avatar, nickname)
@@ -97,3 +98,12 @@ def file_picker(callback, chat_widget):
 
 def to_clipboard(text):
     os.system("echo {} | xclip -selection c".format(shlex.quote(text)))
+
+
+def open_file(path):
+    """Open a file with the default application"""
+    if PLATFORM == "Darwin":
+        subprocess.Popen(["open", path])
+    else:
+        subprocess.Popen(["xdg-open", path], stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL)
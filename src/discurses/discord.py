@@ -1,5 +1,3 @@
-import os
-from enum import Enum
 from typing import List
 
 import logging
@@ -8,28 +6,90 @@ from discord import Channel, Message
 
 import discurses.config as config
 import discurses.ui as ui
+from discurses.cache import AvatarCache
+from discurses.media import MediaManager
+from discurses.notifications import NotificationSetting, RuleEngine
+from discurses.prefetch import Prefetcher
+from discurses.store import MessageStore
+from discurses.tasks import Priority, TaskSupervisor
+from discurses.uploads import UploadManager
+from discurses.unread import UnreadIndex
 
 logger = logging.getLogger(__name__)
 
 
+# Events dispatched to the handlers added with `add_event_handler`
+EVENTS = (
+    "on_message",
+    "on_message_edit",
+    "on_message_delete",
+    "on_typing",
+    "on_member_join",
+    "on_member_remove",
+    "on_member_update",
+    "on_server_role_update",
+    "on_server_role_delete",
+    "on_author_update",
+    "on_unread_update",
+    "on_task_error",
+    "on_resumed",
+)
+
+# Events about a channel or one of its messages, the first argument
+CHANNEL_EVENTS = ("on_message_edit", "on_message_delete", "on_typing")
+
+# Events about a member or role of a server, the first argument
+SERVER_EVENTS = ("on_member_join", "on_member_remove", "on_member_update",
+                 "on_server_role_update", "on_server_role_delete")
+
+
+def start_services(client, warm_start=True):
+    """
+    Create the caches, task supervisor and UI of `client`, a DiscordClient
+    or a ClientGroup whose accounts share them.
+    """
+    client.tasks = TaskSupervisor(client)
+    client.avatars = AvatarCache(client.http.session, client.loop)
+    client.media = MediaManager(client.loop)
+    client.uploads = UploadManager(client)
+    client.unread = UnreadIndex(client)
+    client.message_store = MessageStore(client)
+    client.prefetcher = Prefetcher(client, client.message_store)
+    client.ui = ui.MainUI(client)
+    if warm_start:
+        client.ui.warm_start()
+
+
 class DiscordClient(discord.Client):
-    def __init__(self, *args, **kwargs):
+    # Services shared by the accounts of a ClientGroup
+    SHARED = ('tasks', 'avatars', 'media', 'uploads', 'unread',
+              'message_store', 'prefetcher', 'ui')
+
+    def __init__(self, *args, screen=None, recorder=None, warm_start=True,
+                 token=None, group=None, **kwargs):
         super().__init__(*args, **kwargs)
-        self.ui = ui.MainUI(self)
+        self.screen = screen
+        # The token of the account, by default the one in discurses.yaml
+        self.token = token
+        self.group = group
+        self.received_ready = False
+        if recorder is not None:
+            recorder.attach(self)
         self._server_settings = {}
-        self.read_state = {}
-        self.event_handlers = {
-            "on_message": [],
-            "on_message_edit": [],
-            "on_message_delete": [],
-            "on_typing": [],
-            "on_member_join": [],
-            "on_member_remove": [],
-            "on_member_update": [],
-        }
+        self.rules = RuleEngine(self)
+        if group is None:
+            self.event_handlers = {event: [] for event in EVENTS}
+        else:
+            self.event_handlers = group.event_handlers
 
         def _create_event_handler(name):
             async def eh(*args, **kwargs):
+                if name in CHANNEL_EVENTS and not self.dispatches(
+                        getattr(args[0], 'channel', args[0])):
+                    return
+                if name in SERVER_EVENTS and \
+                        not self.dispatches_server(args[0].server):
+                    return
                 logger.debug("Running {} event handlers for {}".format(
                     len(self.event_handlers[name]), name))
                 for f in self.event_handlers[name]:
@@ -40,6 +100,9 @@ class DiscordClient(discord.Client):
             if not hasattr(self, event):
                 setattr(self, event, _create_event_handler(event))
 
+        if group is None:
+            start_services(self, warm_start)
+
     def add_event_handler(self, event, f):
         logger.debug("Added event handler for %s: %s" %
                      (event,
@@ -47,32 +110,82 @@ class DiscordClient(discord.Client):
                       + f.__class__.__name__ + "." + f.__name__))
         self.event_handlers[event].append(f)
 
+    def remove_event_handlers(self, owner):
+        """Remove all event handlers that are methods of `owner`"""
+        for handlers in self.event_handlers.values():
+            handlers[:] = [f for f in handlers
+                           if getattr(f, '__self__', None) is not owner]
+
     async def on_ready(self):
+        if self.group is not None:
+            self.group.channel_clients.clear()
+        if self.received_ready:
+            # A new session after the connection was lost
+            self.ui.on_ready(reconnected=True)
+            await self.on_resumed()
+            return
+        self.received_ready = True
         self.ui.notify("Logged in as %s" % self.user.name)
-        self.ui.on_ready()
+        # The tabs are reconciled once every account is ready
+        if self.group is None or self.group.all_ready:
+            self.ui.on_ready()
+
+    async def on_resumed(self):
+        """
+        Let the handlers load what was missed in the channels this client
+        dispatches, as `f(client)`.
+        """
+        logger.info("Connection resumed")
+        for f in self.event_handlers["on_resumed"]:
+            f(self)
 
     async def on_message(self, m: Message):
-        if m.channel.is_private and config.table['notify']:
+        if not self.dispatches(m.channel):
+            return
+        if config.table['notify'] and self.rules.should_notify(m):
             await config.send_notification(self, m)
-        else:
-            ss = await self.get_server_settings(m.server)
-            if ss.should_be_notified(m) and config.table['notify']:
-                await config.send_notification(self, m)
+        self.unread.on_message(m)
         logger.debug("Running %d event handlers for on_message" %
                      len(self.event_handlers["on_message"]))
         for f in self.event_handlers["on_message"]:
             f(m)
 
     async def login(self):
-        await super().login(config.table['token'], bot=False)
-
-    def async_do(self, f):
-        self.loop.create_task(f)
-
-    async def get_logs_from(self, channel: Channel) -> List[Message]:
+        await super().login(self.token or config.table['token'], bot=False)
+
+    def client_for(self, channel):
+        """The client of the account `channel` belongs to"""
+        return self
+
+    def dispatches(self, channel):
+        """
+        Whether events in `channel` are dispatched by this client, rather
+        than by another account of its group that is in the same server
+        """
+        return self.group is None or self.group.client_for(channel) is self
+
+    def dispatches_server(self, server):
+        """
+        Whether events about the members and roles of `server` are
+        dispatched by this client, rather than by another account of its
+        group that is in it too
+        """
+        return self.group is None or \
+            self.group.client_for_server(server) is self
+
+    def async_do(self, f, name=None, scope=None,
+                 priority=Priority.INTERACTIVE):
+        """
+        Run the coroutine `f` as a task of `scope`.
+        See `TaskSupervisor.spawn`.
+        """
+        return self.tasks.spawn(f, name, scope, priority)
+
+    async def get_logs_from(self, channel: Channel, limit=100,
+                            **kwargs) -> List[Message]:
         messages = []
         logger.debug("getting logs")
-        async for m in self.logs_from(channel, limit=20):
+        async for m in self.logs_from(channel, limit=limit, **kwargs):
             messages.append(m)
         logger.debug("got logs")
         return messages
@@ -86,35 +199,18 @@ class DiscordClient(discord.Client):
                 ss['server'] = self.get_server(ss.get('guild_id'))
                 self._server_settings[ss.get('guild_id')] = \
                     ServerSettings(self, ss)
-            read_state = d.get("read_state")
-            for st in read_state:
-                rs = ReadState(self, st)
-                self.read_state[rs.channel] = rs
+                self.rules.settings_updated(ss.get('guild_id'))
+            self.unread.seed(d)
+        if t == 'MESSAGE_ACK':
+            self.unread.ack(d.get('channel_id'), d.get('message_id'))
         if t == 'USER_GUILD_SETTINGS_UPDATE':
                 d['server'] = self.get_server(d.get('guild_id'))
                 self._server_settings[d.get('guild_id')] = \
                     ServerSettings(self, d)
-
-    async def get_server_settings(self, server):
-        if server.id not in self._server_settings:
-            self._server_settings[server.id] = ServerSettings(
-                self, {'server': server})
-        return self._server_settings[server.id]
+                self.rules.settings_updated(d.get('guild_id'))
 
     async def get_avatar(self, user):
-        avatar_id = user.avatar
-        if avatar_id is None:
-            avatar_id = user.default_avatar
-        filepath = os.path.join(config.CACHE_AVATARS_PATH,
-                                "{0}.jpg".format(avatar_id))
-        if not os.path.isfile(filepath):
-            avatar_url = user.avatar_url
-            if avatar_url == "":
-                avatar_url = user.default_avatar_url
-            content = await self.http.session.get(avatar_url)
-            f = open(filepath, 'wb+')
-            f.write(await content.read())
-        return filepath
+        return await self.avatars.get_avatar(user)
 
     async def send_ack(self, message):
         self.http.post(self.http.CHANNELS + "/"
@@ -135,6 +231,7 @@ class ServerSettings:
         self.supress_everyone = data.get('supress_everyone', False)
         self.channel_overrides = {}
         channel_overrides = data.get('channel_overrides')
+        # See RuleEngine for how they are applied
         if channel_overrides is not None:
             for chov in channel_overrides:
                 self.channel_overrides[chov.get('channel_id')] = {
@@ -142,51 +239,3 @@ class ServerSettings:
                     'notifications':
                     NotificationSetting(int(chov.get('message_notifications'))),
                 }
-
-    def get_notifications(self, channel):
-        res = None
-        if channel.id in self.channel_overrides.keys():
-            res = self.channel_overrides[channel.id]['notifications']
-        if res == NotificationSetting.undefined or res is None:
-            res = self.notifications
-        return res
-
-    def get_muted(self, channel):
-        res = None
-        if channel.id in self.channel_overrides.keys():
-            res = self.channel_overrides[channel.id]['muted']
-        if res is None:
-            res = self.muted
-        return res
-
-    def should_be_notified(self, message):
-        if self.discord.user == message.author:
-            return False
-        mentioned = self.discord.user in message.mentions
-        notific = self.get_notifications(message.channel)
-        muted = self.get_muted(message.channel)
-        if notific == NotificationSetting.all:
-            if muted:
-                return mentioned
-            return True
-        if notific == NotificationSetting.mentions:
-            return mentioned
-        return False
-
-
-class NotificationSetting(Enum):
-    all = 0
-    mentions = 1
-    nothing = 2
-    undefined = 3
-
-
-class ReadState:
-    def __init__(self, discord_client, data):
-        self.discord = discord_client
-        self._update(data)
-
-    def _update(self, data):
-        self.channel = self.discord.get_channel(data.get('id'))
-        self.last_message = self.discord.get_message(
-            self.channel, data.get('last_message_id'))
@@ -0,0 +1,398 @@
+"""
+A local stand-in for the discord API, for load testing.
+
+It serves enough of the REST API and the gateway for a client to log in,
+read history, send messages, type and set its presence, and it generates
+synthetic traffic. Run it with `python -m discurses.fakeserver` and point
+discurses at it with `--api-base http://127.0.0.1:8765/api/v7`.
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import random
+
+import aiohttp
+from aiohttp import web
+
+from discord.utils import snowflake_time, time_snowflake
+
+logger = logging.getLogger(__name__)
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do "
+         "eiusmod tempor incididunt ut labore et dolore magna aliqua").split()
+
+OP_DISPATCH = 0
+OP_HEARTBEAT = 1
+OP_IDENTIFY = 2
+OP_PRESENCE = 3
+OP_RESUME = 6
+OP_REQUEST_MEMBERS = 8
+OP_HELLO = 10
+OP_HEARTBEAT_ACK = 11
+
+
+# Members per GUILD_MEMBERS_CHUNK, as discord sends them
+CHUNK_SIZE = 1000
+
+
+def timestamp(dt=None):
+    return (dt or datetime.datetime.utcnow()).isoformat() + "+00:00"
+
+
+def json_response(data, status=200):
+    """
+    A JSON response. discord.py only decodes bodies whose content type is
+    exactly application/json, without a charset.
+    """
+    return web.Response(body=json.dumps(data).encode('utf-8'),
+                        status=status, content_type='application/json')
+
+
+class FakeDiscord:
+    """
+    The state of the fake server: `guilds` guilds with `members` members and
+    `channels` text channels each. `rate` messages per second are created
+    in random channels, along with `typing_rate` typing events and
+    `presence_rate` presence updates.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8765, guilds=5, members=100,
+                 channels=10, rate=1.0, typing_rate=0.5, presence_rate=0.5,
+                 loop=None):
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.typing_rate = typing_rate
+        self.presence_rate = presence_rate
+        self.loop = loop or asyncio.get_event_loop()
+        self._ids = itertools.count(time_snowflake(datetime.datetime.utcnow()))
+        self.sockets = {}
+        self.sent = 0
+        self.user = self._user("discurses")
+        self.guilds = [self._guild(i, members, channels)
+                       for i in range(guilds)]
+        self.channels = {ch['id']: (g, ch)
+                         for g in self.guilds for ch in g['channels']}
+
+    def next_id(self):
+        return str(next(self._ids))
+
+    def _user(self, name):
+        return {'id': self.next_id(), 'username': name,
+                'discriminator': "{0:04}".format(random.randint(1, 9999)),
+                'avatar': None, 'bot': False}
+
+    def _guild(self, index, members, channels):
+        guild_id = self.next_id()
+        users = [self.user] + [self._user("user{0}".format(i))
+                               for i in range(members)]
+        return {
+            'id': guild_id,
+            'name': "guild{0}".format(index),
+            'owner_id': self.user['id'],
+            'region': 'local',
+            'icon': None,
+            'large': members > 250,
+            'member_count': len(users),
+            'roles': [{'id': guild_id, 'name': '@everyone', 'color': 0,
+                       'position': 0, 'permissions': 104324161,
+                       'hoist': False, 'managed': False,
+                       'mentionable': False}],
+            'channels': [{'id': self.next_id(), 'guild_id': guild_id,
+                          'name': "channel-{0}".format(i), 'type': 0,
+                          'position': i, 'topic': None,
+                          'permission_overwrites': []}
+                         for i in range(channels)],
+            'members': [{'user': u, 'roles': [], 'nick': None,
+                         'joined_at': timestamp(), 'deaf': False,
+                         'mute': False}
+                        for u in users],
+            'presences': [{'user': {'id': u['id']}, 'status': 'online',
+                           'game': None}
+                          for u in users[::2]],
+            'emojis': [],
+            'features': [],
+            'verification_level': 0,
+            'default_message_notifications': 0,
+            'mfa_level': 0,
+            'afk_timeout': 300,
+            'afk_channel_id': None,
+        }
+
+    def _message(self, channel_id, author, content, when=None, nonce=None):
+        message_id = self.next_id() if when is None else \
+            str(time_snowflake(when) + random.randint(0, 2 ** 22 - 1))
+        return {
+            'id': message_id,
+            'channel_id': channel_id,
+            'author': author,
+            'content': content,
+            'timestamp': timestamp(when),
+            'edited_timestamp': None,
+            'tts': False,
+            'mention_everyone': False,
+            'mentions': [],
+            'mention_roles': [],
+            'attachments': [],
+            'embeds': [],
+            'pinned': False,
+            'type': 0,
+            'nonce': nonce,
+        }
+
+    def _random_text(self):
+        return " ".join(random.choice(WORDS)
+                        for _ in range(random.randint(1, 30)))
+
+    def _random_member(self, guild):
+        return random.choice(guild['members'])['user']
+
+    # Gateway
+
+    def send(self, ws, event, data):
+        """Send a dispatch to one connected client"""
+        self.sockets[ws] += 1
+        ws.send_str(json.dumps({'op': OP_DISPATCH, 't': event,
+                                's': self.sockets[ws], 'd': data}))
+        self.sent += 1
+
+    def dispatch(self, event, data):
+        """Send a dispatch to every connected client"""
+        for ws in self.sockets:
+            self.send(ws, event, data)
+
+    def send_members(self, ws, guild_ids):
+        """
+        Answer a request for the members of guilds, which discord.py makes
+        for every guild of a user account before it is ready.
+        """
+        if isinstance(guild_ids, str):
+            guild_ids = [guild_ids]
+        guilds = {guild['id']: guild for guild in self.guilds}
+        for guild_id in guild_ids:
+            guild = guilds.get(guild_id)
+            if guild is None:
+                continue
+            members = guild['members']
+            for start in range(0, len(members), CHUNK_SIZE):
+                self.send(ws, 'GUILD_MEMBERS_CHUNK', {
+                    'guild_id': guild_id,
+                    'members': members[start:start + CHUNK_SIZE]})
+
+    def ready(self):
+        return {
+            'v': 6,
+            'user': self.user,
+            'session_id': self.next_id(),
+            'guilds': self.guilds,
+            'private_channels': [],
+            'relationships': [],
+            'presences': [],
+            'user_settings': {},
+            'user_guild_settings': [],
+            'read_state': [],
+            '_trace': ["discurses-fakeserver"],
+        }
+
+    async def gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        ws.send_str(json.dumps({'op': OP_HELLO, 'd': {
+            'heartbeat_interval': 41250, '_trace': []}}))
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                payload = json.loads(msg.data)
+                op = payload.get('op')
+                if op == OP_HEARTBEAT:
+                    ws.send_str(json.dumps({'op': OP_HEARTBEAT_ACK}))
+                elif op in (OP_IDENTIFY, OP_RESUME):
+                    if op == OP_IDENTIFY:
+                        event, data = 'READY', self.ready()
+                    else:
+                        event, data = 'RESUMED', {'_trace': []}
+                    ws.send_str(json.dumps({'op': OP_DISPATCH, 't': event,
+                                            's': 1, 'd': data}))
+                    self.sockets[ws] = 1
+                elif op == OP_PRESENCE:
+                    data = payload.get('d', {})
+                    for guild in self.guilds:
+                        self.dispatch('PRESENCE_UPDATE', {
+                            'guild_id': guild['id'],
+                            'user': {'id': self.user['id']},
+                            'status': data.get('status') or 'online',
+                            'game': data.get('game'),
+                            'roles': [],
+                        })
+                elif op == OP_REQUEST_MEMBERS and ws in self.sockets:
+                    self.send_members(
+                        ws, payload.get('d', {}).get('guild_id', []))
+        finally:
+            self.sockets.pop(ws, None)
+        return ws
+
+    # REST
+
+    async def get_gateway(self, request):
+        return json_response({'url': "ws://{0}:{1}/gateway".format(
+            self.host, self.port)})
+
+    async def get_me(self, request):
+        return json_response(self.user)
+
+    async def get_messages(self, request):
+        channel_id = request.match_info['channel_id']
+        if channel_id not in self.channels:
+            return json_response({'code': 10003}, status=404)
+        guild, _channel = self.channels[channel_id]
+        limit = min(int(request.GET.get('limit', 50)), 100)
+        # The history has a message every minute up to now
+        now = datetime.datetime.utcnow()
+        minute = datetime.timedelta(minutes=1)
+        if 'after' in request.GET:
+            start = snowflake_time(request.GET['after'])
+            times = [start + minute * (i + 1) for i in range(limit)]
+        elif 'around' in request.GET:
+            middle = snowflake_time(request.GET['around'])
+            times = [middle + minute * i
+                     for i in range(-(limit - limit // 2), limit // 2)]
+        else:
+            end = now
+            if 'before' in request.GET:
+                end = snowflake_time(request.GET['before'])
+            times = [end - minute * (i + 1) for i in range(limit)]
+        # Newest first, as discord sends them
+        times = sorted((t for t in times if t < now), reverse=True)
+        messages = [self._message(channel_id, self._random_member(guild),
+                                  self._random_text(), when=when)
+                    for when in times]
+        return json_response(messages)
+
+    async def post_message(self, request):
+        channel_id = request.match_info['channel_id']
+        data = await request.json()
+        message = self._message(channel_id, self.user, data.get('content'),
+                                nonce=data.get('nonce'))
+        self.dispatch('MESSAGE_CREATE', message)
+        return json_response(message)
+
+    async def edit_message(self, request):
+        data = await request.json()
+        message = self._message(request.match_info['channel_id'], self.user,
+                                data.get('content'))
+        message['id'] = request.match_info['message_id']
+        message['edited_timestamp'] = timestamp()
+        self.dispatch('MESSAGE_UPDATE', message)
+        return json_response(message)
+
+    async def delete_message(self, request):
+        self.dispatch('MESSAGE_DELETE', {
+            'id': request.match_info['message_id'],
+            'channel_id': request.match_info['channel_id']})
+        return web.Response(status=204)
+
+    async def typing(self, request):
+        self.dispatch('TYPING_START', {
+            'channel_id': request.match_info['channel_id'],
+            'user_id': self.user['id'],
+            'timestamp': int(datetime.datetime.utcnow().timestamp())})
+        return web.Response(status=204)
+
+    async def ack(self, request):
+        return json_response({'token': None})
+
+    # Load generation
+
+    async def _generate(self, rate, make):
+        if rate <= 0:
+            return
+        while True:
+            await asyncio.sleep(random.expovariate(rate))
+            if self.sockets:
+                make()
+
+    def _create_message(self):
+        channel_id = random.choice(list(self.channels))
+        guild, _channel = self.channels[channel_id]
+        self.dispatch('MESSAGE_CREATE', self._message(
+            channel_id, self._random_member(guild), self._random_text()))
+
+    def _start_typing(self):
+        channel_id = random.choice(list(self.channels))
+        guild, _channel = self.channels[channel_id]
+        self.dispatch('TYPING_START', {
+            'channel_id': channel_id,
+            'user_id': self._random_member(guild)['id'],
+            'timestamp': int(datetime.datetime.utcnow().timestamp())})
+
+    def _update_presence(self):
+        guild = random.choice(self.guilds)
+        self.dispatch('PRESENCE_UPDATE', {
+            'guild_id': guild['id'],
+            'user': {'id': self._random_member(guild)['id']},
+            'status': random.choice(['online', 'idle', 'offline']),
+            'game': None,
+            'roles': [],
+        })
+
+    def make_app(self):
+        app = web.Application(loop=self.loop)
+        channel = '/api/v7/channels/{channel_id}'
+        app.router.add_route('GET', '/gateway', self.gateway)
+        app.router.add_route('GET', '/api/v7/gateway', self.get_gateway)
+        app.router.add_route('GET', '/api/v7/users/@me', self.get_me)
+        app.router.add_route('GET', channel + '/messages', self.get_messages)
+        app.router.add_route('POST', channel + '/messages',
+                             self.post_message)
+        app.router.add_route('PATCH', channel + '/messages/{message_id}',
+                             self.edit_message)
+        app.router.add_route('DELETE', channel + '/messages/{message_id}',
+                             self.delete_message)
+        app.router.add_route('POST', channel + '/messages/{message_id}/ack',
+                             self.ack)
+        app.router.add_route('POST', channel + '/typing', self.typing)
+        return app
+
+    async def start(self):
+        handler = self.make_app().make_handler()
+        self.server = await self.loop.create_server(
+            handler, self.host, self.port)
+        # Port 0 is any free port
+        self.port = self.server.sockets[0].getsockname()[1]
+        for rate, make in ((self.rate, self._create_message),
+                           (self.typing_rate, self._start_typing),
+                           (self.presence_rate, self._update_presence)):
+            self.loop.create_task(self._generate(rate, make))
+        logger.info("Fake discord listening on %s:%d", self.host, self.port)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='discurses.fakeserver')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--guilds', type=int, default=5)
+    parser.add_argument('--members', type=int, default=100,
+                        help="members per guild")
+    parser.add_argument('--channels', type=int, default=10,
+                        help="text channels per guild")
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help="messages per second across all channels")
+    parser.add_argument('--typing-rate', type=float, default=0.5)
+    parser.add_argument('--presence-rate', type=float, default=0.5)
+    args = parser.parse_args(args)
+    logging.basicConfig(level=logging.INFO)
+    loop = asyncio.get_event_loop()
+    server = FakeDiscord(host=args.host, port=args.port, guilds=args.guilds,
+                         members=args.members, channels=args.channels,
+                         rate=args.rate, typing_rate=args.typing_rate,
+                         presence_rate=args.presence_rate, loop=loop)
+    loop.run_until_complete(server.start())
+    loop.run_forever()
+
+
+if __name__ == '__main__':
+    main()
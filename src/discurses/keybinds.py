@@ -1,3 +1,4 @@
+import functools
 import logging
 
 logger = logging.getLogger(__name__)
@@ -38,11 +39,19 @@ class KeyMap:
     A keymap contains two things:
     A list of commands, defined using the `@keybind` decorator,
     and a list of key to command mappings.
+
+    Keys can be sequences, given as a tuple of keys, such as `("g", "g")`.
+
+    Every widget using the keymap gets its own dispatch table, compiled on
+    its first keypress. It holds the commands of the widget's class and
+    those bound to the widget itself with `bind`, and it goes away with
+    the widget.
     """
 
     def __init__(self, keys={}):
         self.commands = {}
         self.keys = {}
+        self.version = 0
         for key, commands in keys.items():
             self.add_key(key, commands)
 
@@ -51,10 +60,20 @@ class KeyMap:
         Add a command to the command map.
         If the command already exists, the function will be added to the list
         """
-        if name in self.commands.keys():
+        if name in self.commands:
             self.commands[name].append(func)
         else:
             self.commands[name] = [func]
+        self.version += 1
+
+    def bind(self, widget, name, func):
+        """
+        Add `func` to the command `name`, but only for `widget`.
+        `func` is called without the widget as first argument.
+        """
+        bindings = widget.__dict__.setdefault('_keymap_bindings', {})
+        bindings.setdefault((self, name), []).append(func)
+        widget.__dict__.get('_keymap_tables', {}).pop(self, None)
 
     def add_key(self, key, command):
         """
@@ -68,15 +87,18 @@ class KeyMap:
 
         If the key is already mapped, the command will be added to its list
         """
+        if not isinstance(key, tuple):
+            key = (key,)
         if not isinstance(command, list) and not isinstance(command, set):
             command = {command}
         for c in command:
             if not isinstance(c, tuple):
                 c = (c,)
-            if key in self.keys.keys():
+            if key in self.keys:
                 self.keys[key].append(c)
             else:
                 self.keys[key] = [c]
+        self.version += 1
 
     def command(self, func):
         """
@@ -103,19 +125,24 @@ class KeyMap:
         """
         Calls the commands associated with `key`
         Will return `None` or the result of the last command that wasnt `None`
+
+        A key that starts a sequence is consumed, and the sequence continues
+        with the next key. If that key does not continue it, the commands of
+        the sequence so far are called, and the key is handled on its own.
         """
-        k = key
-        if key in self.keys.keys():
-            k = None
-            for command in self.keys[key]:
-                assert command[0] in self.commands
-                if len(command) > 1:
-                    nk = self.call_command(command[0], widget, *command[1:])
-                else:
-                    nk = self.call_command(command[0], widget)
-                if nk is not None:
-                    k = nk
-        return k
+        table = self._get_table(widget)
+        node = table.pending or table.root
+        table.pending = None
+        child = node.children.get(key)
+        if child is None and node is not table.root:
+            self._run(node.actions)
+            child = table.root.children.get(key)
+        if child is None:
+            return key
+        if child.children:
+            table.pending = child
+            return None
+        return self._run(child.actions)
 
     def call_command(self, command, *args, **kwargs):
         """
@@ -123,10 +150,70 @@ class KeyMap:
         Will return `None` or the result of the last function that wasnt `None`
         """
         key = None
-        logger.debug("Calling %d commands for '%s'",
-                     len(self.commands[command]), command)
         for fn in self.commands[command]:
             k = fn(*args, **kwargs)
             if k is not None:
                 key = k
         return key
+
+    @staticmethod
+    def _run(actions):
+        key = None
+        for action in actions:
+            k = action()
+            if k is not None:
+                key = k
+        return key
+
+    def _get_table(self, widget):
+        tables = widget.__dict__.setdefault('_keymap_tables', {})
+        table = tables.get(self)
+        if table is None or table.version != self.version:
+            table = tables[self] = self._compile(widget)
+        return table
+
+    def _resolve(self, widget, name):
+        """All functions of command `name` that apply to `widget`"""
+        functions = []
+        cls = type(widget)
+        for fn in self.commands.get(name, []):
+            if '.' not in fn.__qualname__:
+                functions.append(functools.partial(fn, widget))
+            elif getattr(cls, fn.__name__, None) is fn:
+                functions.append(functools.partial(fn, widget))
+        bindings = widget.__dict__.get('_keymap_bindings', {})
+        functions += bindings.get((self, name), [])
+        if functions == []:
+            logger.warning("No command '%s' for %s", name, cls.__name__)
+        return functions
+
+    def _compile(self, widget):
+        """Compile the key sequences into a prefix trie of bound actions"""
+        table = _DispatchTable(self.version)
+        for sequence, commands in self.keys.items():
+            node = table.root
+            for key in sequence:
+                node = node.children.setdefault(key, _TrieNode())
+            for command in commands:
+                for fn in self._resolve(widget, command[0]):
+                    if len(command) > 1:
+                        fn = functools.partial(fn, *command[1:])
+                    node.actions.append(fn)
+        return table
+
+
+class _TrieNode:
+    __slots__ = ('actions', 'children')
+
+    def __init__(self):
+        self.actions = []
+        self.children = {}
+
+
+class _DispatchTable:
+    __slots__ = ('version', 'root', 'pending')
+
+    def __init__(self, version):
+        self.version = version
+        self.root = _TrieNode()
+        self.pending = None
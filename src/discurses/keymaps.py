@@ -5,6 +5,7 @@ GLOBAL = KeyMap({
     "ctrl l": "redraw",
     "ctrl t": "focus_tab_selector",
     "meta t": "focus_tab_selector",
+    "meta o": "show_output_stats",
 })
 
 TAB_SELECTOR = KeyMap({
@@ -24,12 +25,16 @@ CHAT = KeyMap({
     "down": "focus_down",
     "meta n": "ask_rename_tab",
     "meta c": "ask_shell_command",
+    "meta j": "ask_jump",
     "meta f": "ask_send_file",
+    "meta x": "cancel_upload",
     "ctrl l": "refetch_messages",
 })
 
 MESSAGE_LIST = KeyMap({
-    "esc": "focus_message_textbox"
+    "esc": "focus_message_textbox",
+    ("g", "g"): "scroll_to_top",
+    "G": "scroll_to_bottom",
 })
 
 MESSAGE_LIST_ITEM = KeyMap({
@@ -38,6 +43,9 @@ MESSAGE_LIST_ITEM = KeyMap({
     "r": ["quote_message", "select_channel"],
     "m": "mention_author",
     "y": "yank_message",
+    "o": "open_attachment",
+    "w": "ask_save_attachment",
+    "e": "toggle_expanded",
     "s": "select_channel",
     " ": "select_channel",
 })
@@ -76,6 +84,12 @@ SERVER_TREE_SERVER = KeyMap({
     "q": "exit"
 })
 
+SHELL_OUTPUT = KeyMap({
+    "enter": "insert_output",
+    "meta enter": "send_output",
+    "esc": "cancel",
+})
+
 TEXT_EDIT_WIDGET = KeyMap({
     "enter": "save",
     "esc": "cancel",
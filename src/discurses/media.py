@@ -0,0 +1,148 @@
+"""Downloads of attachments."""
+import asyncio
+import os
+import re
+import urllib.parse
+
+import aiohttp
+
+import discurses.config as config
+from discurses.cache import FileCache
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MediaError(Exception):
+    pass
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+class MediaManager:
+    """
+    Downloads attachments into the media cache.
+
+    All downloads share one connection pool, with at most `per_host` of
+    them running per host. Responses are streamed to disk in chunks, and an
+    interrupted download is resumed from where it stopped. The cache is
+    capped at `max_bytes`.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, loop, directory=config.CACHE_MEDIA_PATH,
+                 max_bytes=None, per_host=None):
+        if max_bytes is None:
+            max_bytes = config.table.get('media_cache_size', 500) * 2 ** 20
+        if per_host is None:
+            per_host = config.table.get('media_downloads_per_host', 4)
+        self.loop = loop
+        self.cache = FileCache(directory, max_bytes, loop)
+        self.per_host = per_host
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(loop=loop, limit=4 * per_host),
+            loop=loop)
+        self._hosts = {}
+        self._in_flight = {}
+
+    @staticmethod
+    def cache_name(attachment):
+        filename = re.sub(r"[^\w.-]", "_", attachment.get('filename', ''))
+        return "{0}-{1}".format(attachment.get('id'), filename)
+
+    def _host_semaphore(self, url):
+        host = urllib.parse.urlsplit(url).hostname
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return self._hosts[host]
+
+    async def fetch(self, attachment, progress=None):
+        """
+        The path of the downloaded `attachment`, a discord attachment dict.
+        `progress(done, total)` is called as bytes arrive.
+        """
+        name = self.cache_name(attachment)
+        path = self.cache.get(name)
+        if path is not None:
+            return path
+        future = self._in_flight.get(name)
+        if future is None:
+            future = asyncio.ensure_future(
+                self._download(attachment.get('url'), name,
+                               attachment.get('size'), progress),
+                loop=self.loop)
+            self._in_flight[name] = future
+            future.add_done_callback(
+                lambda f: self._in_flight.pop(name, None))
+        return await asyncio.shield(future)
+
+    def _get(self, url, done):
+        headers = {}
+        if done > 0:
+            headers['Range'] = "bytes={0}-".format(done)
+        return self.session.get(url, headers=headers)
+
+    async def _download(self, url, name, size, progress):
+        part_name = name + ".part"
+        # Not to be evicted while it is written to
+        self.cache.forget(part_name)
+        try:
+            return await self._download_part(url, name, size, progress)
+        except BaseException:
+            # Kept to be resumed
+            part_size = _file_size(self.cache.path(part_name))
+            if part_size > 0:
+                self.cache.add(part_name, part_size)
+            raise
+
+    async def _download_part(self, url, name, size, progress):
+        path = self.cache.path(name)
+        part = path + ".part"
+        run = self.loop.run_in_executor
+        async with self._host_semaphore(url):
+            done = await run(None, _file_size, part)
+            response = await self._get(url, done)
+            if response.status == 416 and 0 < done != size:
+                # The partial file does not match the attachment, start over
+                response.release()
+                await run(None, os.unlink, part)
+                done = 0
+                response = await self._get(url, done)
+            try:
+                if response.status == 200:
+                    done = 0
+                elif response.status == 416 and done == size:
+                    pass
+                elif response.status != 206:
+                    raise MediaError("HTTP {0} for {1}".format(
+                        response.status, url))
+                if response.status != 416:
+                    logger.debug("Downloading %s from byte %d", url, done)
+                    file = await run(None, open, part, 'ab' if done else 'wb')
+                    try:
+                        while True:
+                            chunk = await response.content.read(
+                                self.CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            await run(None, file.write, chunk)
+                            done += len(chunk)
+                            if progress is not None:
+                                progress(done, size)
+                    finally:
+                        await run(None, file.close)
+            finally:
+                response.release()
+        await run(None, os.replace, part, path)
+        self.cache.add(name, done)
+        return path
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,123 @@
+"""When to notify of messages, and which words of them to highlight."""
+from enum import Enum
+import re
+
+import discurses.config as config
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationSetting(Enum):
+    all = 0
+    mentions = 1
+    nothing = 2
+    undefined = 3
+
+
+def compile_highlights(rules):
+    """
+    One regex matching any of the highlight `rules`, or None if there are
+    none. A rule between slashes is a regex, any other a word, both
+    matched ignoring case. Invalid regexes are left out.
+    """
+    patterns = []
+    for rule in rules or ():
+        rule = str(rule)
+        if len(rule) > 2 and rule.startswith("/") and rule.endswith("/"):
+            pattern = rule[1:-1]
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                logger.warning("Invalid highlight %s: %s", rule, e)
+                continue
+        elif rule:
+            pattern = r"\b" + re.escape(rule) + r"\b"
+        else:
+            continue
+        patterns.append("(?:" + pattern + ")")
+    if not patterns:
+        return None
+    return re.compile("|".join(patterns), re.IGNORECASE)
+
+
+class RuleEngine:
+    """
+    The notification settings of every server and their channel overrides,
+    flattened into what to notify of per channel, and the highlight rules
+    of discurses.yaml compiled into one regex.
+
+    The decision of a channel is worked out the first time one of its
+    messages arrives, and dropped when the settings of its server are
+    updated. The highlights are compiled again when the `highlight` key
+    of the configuration changes.
+    """
+
+    def __init__(self, discord_client):
+        self.discord = discord_client
+        # Channel id -> NotificationSetting, never undefined and with
+        # muting applied
+        self.decisions = {}
+        # Server id -> ids of its channels in `decisions`
+        self.server_channels = {}
+        self._rules = None
+        self._matcher = None
+
+    @property
+    def matcher(self):
+        """The compiled highlight rules, or None if there are none"""
+        rules = list(config.table.get('highlight') or ())
+        if rules != self._rules:
+            self._rules = rules
+            self._matcher = compile_highlights(self._rules)
+        return self._matcher
+
+    def settings_updated(self, server_id):
+        """Forget the decisions made with the old settings of a server"""
+        for channel_id in self.server_channels.pop(server_id, ()):
+            self.decisions.pop(channel_id, None)
+
+    def decision(self, channel):
+        """What to notify of in `channel`"""
+        decision = self.decisions.get(channel.id)
+        if decision is None:
+            decision = self._decide(channel)
+            self.decisions[channel.id] = decision
+            self.server_channels.setdefault(
+                channel.server.id, set()).add(channel.id)
+        return decision
+
+    def _decide(self, channel):
+        settings = self.discord._server_settings.get(channel.server.id)
+        if settings is None:
+            return NotificationSetting.all
+        override = settings.channel_overrides.get(channel.id, {})
+        notifications = override.get('notifications')
+        if notifications in (None, NotificationSetting.undefined):
+            notifications = settings.notifications
+        muted = override.get('muted', settings.muted)
+        if muted and notifications == NotificationSetting.all:
+            return NotificationSetting.mentions
+        return notifications
+
+    def highlighted(self, message):
+        """Whether `message` mentions the user or matches a highlight"""
+        if self.discord.user in message.mentions:
+            return True
+        matcher = self.matcher
+        return matcher is not None and \
+            matcher.search(message.content) is not None
+
+    def should_notify(self, message):
+        """Whether to send a notification of `message`"""
+        if self.discord.user == message.author:
+            return False
+        if message.channel.is_private:
+            return True
+        decision = self.decision(message.channel)
+        if decision == NotificationSetting.all:
+            return True
+        if decision == NotificationSetting.mentions:
+            return self.highlighted(message)
+        return False
@@ -0,0 +1,110 @@
+"""Measurements for load tests and replays."""
+import argparse
+import datetime
+import json
+import random
+import resource
+import sys
+import tracemalloc
+
+from discord import Message, Object
+from discord.utils import time_snowflake
+
+from discurses.records import MessageRecord
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class LatencyProbe:
+    """
+    Measures event-to-screen latency: the time from a message being created,
+    according to its timestamp, to the first screen draw after it arrived.
+    """
+
+    def __init__(self, discord_client):
+        self.pending = []
+        self.latencies = []
+        discord_client.add_event_handler('on_message', self.on_message)
+
+    def attach(self, screen):
+        """Start measuring draws of `screen`"""
+        draw_screen = screen.draw_screen
+
+        def probed_draw_screen(size, canvas):
+            draw_screen(size, canvas)
+            self.drawn()
+
+        screen.draw_screen = probed_draw_screen
+
+    def on_message(self, message):
+        self.pending.append(message.timestamp)
+
+    def drawn(self):
+        if not self.pending:
+            return
+        now = datetime.datetime.utcnow()
+        self.latencies.extend((now - ts).total_seconds()
+                              for ts in self.pending)
+        self.pending = []
+
+    def stats(self):
+        stats = {'messages': len(self.latencies),
+                 'max_rss_kb': max_rss_kb()}
+        for p in (50, 95, 99, 100):
+            value = percentile(self.latencies, p)
+            stats['latency_p{0}_ms'.format(p)] = \
+                None if value is None else round(value * 1000, 1)
+        return stats
+
+
+def record_memory(count, authors=200, words=12):
+    """Bytes allocated per MessageRecord of `count` synthetic messages"""
+    rng = random.Random(0)
+    vocabulary = ["lorem", "ipsum", "dolor", "sit", "amet", "deploy",
+                  "rollback", "the", "a", "is", "broken", "fixed", "again"]
+    pool = [{'id': str(100 + i), 'username': "user{0}".format(i),
+             'discriminator': "0001", 'avatar': None}
+            for i in range(authors)]
+    channel = Object(id="1")
+    first = time_snowflake(datetime.datetime(2017, 1, 1))
+    messages = [Message(reactions=[], channel=channel,
+                        id=str(first + (i << 22)), author=rng.choice(pool),
+                        content=" ".join(rng.choice(vocabulary)
+                                         for _ in range(words)),
+                        attachments=[])
+                for i in range(count)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = [MessageRecord.from_message(m, "1") for m in messages]
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    # The content is shared with the messages, but outlives them
+    size += sum(sys.getsizeof(r.content) for r in records)
+    return {'messages': len(records),
+            'bytes_per_record': round(size / max(1, len(records)), 1)}
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m discurses.perf",
+        description="Measure the memory taken by message records")
+    parser.add_argument("--messages", type=int, default=100000)
+    args = parser.parse_args(args)
+    print(json.dumps(record_memory(args.messages)))
+
+
+if __name__ == '__main__':
+    main()
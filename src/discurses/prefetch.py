@@ -0,0 +1,92 @@
+"""Loading the history of channels before they are opened."""
+import time
+
+import discord
+
+import discurses.config as config
+from discurses.tasks import Priority
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RateBudget:
+    """A token bucket allowing `rate` requests per second, `burst` at once"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Use up a request if the budget allows it"""
+        now = time.monotonic()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Prefetcher:
+    """
+    Loads the history of the channel focused in a server tree into the
+    MessageStore once the focus has rested on it for `delay` seconds,
+    followed by that of the channels with unread mentions. It makes at
+    most `per_minute` requests a minute, and stops when the focus moves.
+    """
+
+    PAGE_SIZE = 50
+
+    def __init__(self, discord_client, store, delay=0.4, per_minute=None):
+        if per_minute is None:
+            per_minute = config.table.get('prefetch_per_minute', 10)
+        self.discord = discord_client
+        self.store = store
+        self.delay = delay
+        self.budget = RateBudget(per_minute / 60, max(1, per_minute // 4))
+        self._handle = None
+
+    def focus(self, channel):
+        """The focus has moved to `channel`, or off channels if None"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self.discord.tasks.cancel(self, "prefetch")
+        if channel is None or not self.discord.received_ready:
+            return
+        self._handle = self.discord.loop.call_later(
+            self.delay, self._start, channel)
+
+    def _start(self, channel):
+        self._handle = None
+        self.discord.async_do(self._run(channel), name="prefetch",
+                              scope=self, priority=Priority.BACKGROUND)
+
+    def _mentioned_channels(self):
+        for channel_id, entry in self.discord.unread.channels.items():
+            if entry.mentions > 0:
+                channel = self.discord.get_channel(channel_id)
+                if channel is not None:
+                    yield channel
+
+    async def _run(self, focused):
+        for channel in [focused] + list(self._mentioned_channels()):
+            if channel.id in self.store:
+                continue
+            if not self.budget.take():
+                logger.debug("Prefetch budget used up")
+                return
+            try:
+                messages = await self.discord.get_logs_from(
+                    channel, self.PAGE_SIZE)
+            except discord.errors.Forbidden:
+                continue
+            self.store.add_page(channel.id, None, messages,
+                                len(messages) < self.PAGE_SIZE)
+            logger.debug("Prefetched %d messages of %s", len(messages),
+                         channel.id)
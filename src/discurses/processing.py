@@ -1,10 +1,54 @@
+import datetime
 import re
+import time
+
+from discord.utils import time_snowflake
+
+from discurses.width import cell_width, truncate
 
 import logging
 logger = logging.getLogger(__name__)
 
 
-def format_incomming(message, chat_widget):
+def parse_snowflake(text):
+    """
+    The snowflake id in `text`, a message id or a local date and time such
+    as "2017-03-14" or "2017-03-14 13:37", or None.
+    """
+    text = text.strip()
+    if text.isdigit():
+        return int(text)
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            dt = datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        return time_snowflake(
+            datetime.datetime.utcfromtimestamp(time.mktime(dt.timetuple())))
+    return None
+
+
+def highlight(text, matcher):
+    """`text` as markup, with the matches of `matcher` highlighted"""
+    markup = []
+    start = 0
+    for match in matcher.finditer(text):
+        if match.end() == match.start():
+            continue
+        if match.start() > start:
+            markup.append(text[start:match.start()])
+        markup.append(("message_mention_self", match.group()))
+        start = match.end()
+    if start < len(text):
+        markup.append(text[start:])
+    return markup
+
+
+def format_incomming(message, user_id, matcher=None):
+    """
+    The content of `message` as markup, with mentions resolved and the
+    matches of the highlight regex `matcher` highlighted.
+    """
     text = message.content
     newtxt = []
     for m in re.split("(<(?:@|@!|#|@&)[0-9]+>)", text):
@@ -17,7 +61,7 @@ def format_incomming(message, chat_widget):
                 member = next((memb for memb in message.mentions
                                if memb.id == snflk), None)
                 if member:
-                    if member.id == chat_widget.discord.user.id:
+                    if member.id == user_id:
                         newtxt.append(("message_mention_self",
                                        "@"+member.name))
                     else:
@@ -28,7 +72,7 @@ def format_incomming(message, chat_widget):
                 member = next((memb for memb in message.mentions
                                if memb.id == snflk), None)
                 if member:
-                    if member.id == chat_widget.discord.user.id:
+                    if member.id == user_id:
                         newtxt.append(("message_mention_self",
                                        "@"+member.display_name))
                     else:
@@ -49,10 +93,87 @@ def format_incomming(message, chat_widget):
                 if role:
                     newtxt.append(("message_mention", "@"+role.name))
                     continue
-        newtxt.append(m)
+        if matcher is not None and m:
+            newtxt.extend(highlight(m, matcher))
+        else:
+            newtxt.append(m)
     return newtxt
 
 
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            break
+        size /= 1024
+    if unit == "B":
+        return "{0} B".format(size)
+    return "{0:.1f} {1}".format(size, unit)
+
+
+def split_code_blocks(text, limit=2000):
+    """
+    Split `text` into code blocks of at most `limit` characters each,
+    on line boundaries where possible.
+    """
+    fence = "```\n{0}\n```"
+    room = limit - len(fence.format(""))
+    chunks = []
+    current = ""
+    for line in text.rstrip("\n").split("\n"):
+        while len(line) > room:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:room])
+            line = line[room:]
+        if current and len(current) + 1 + len(line) > room:
+            chunks.append(current)
+            current = line
+        else:
+            current = current + "\n" + line if current else line
+    if current or not chunks:
+        chunks.append(current)
+    return [fence.format(c) for c in chunks]
+
+
+def clip_markup(markup, lines, chars):
+    """
+    The beginning of urwid `markup`, of at most `lines` lines and `chars`
+    characters, and the number of lines left out. None if it is shorter.
+    """
+    parts = [markup] if isinstance(markup, str) else markup
+    text = "".join(p if isinstance(p, str) else p[1] for p in parts)
+    total = text.count("\n") + 1
+    if total <= lines and len(text) <= chars:
+        return None
+    end = -1
+    for _ in range(lines):
+        end = text.find("\n", end + 1)
+        if end == -1:
+            end = len(text)
+            break
+    end = min(end, chars)
+    head = []
+    position = 0
+    for part in parts:
+        if position >= end:
+            break
+        s = part if isinstance(part, str) else part[1]
+        cut = s[:end - position]
+        head.append(cut if isinstance(part, str) else (part[0], cut))
+        position += len(s)
+    return head, total - text.count("\n", 0, end) - 1
+
+
+def unread_badge(unread, mentions):
+    """A short suffix for labels of things with unread messages"""
+    if mentions > 0:
+        return " (@{0})".format(mentions)
+    if unread > 0:
+        return " ({0})".format(unread)
+    return ""
+
+
 def format_outgoing(text):
     return text
 
@@ -84,21 +205,20 @@ def shorten_channel_names(channels, length):
     if same_server:
         for ch in channels:
             name = channel_name(ch)
-            if len(name) <= length:
+            if cell_width(name) <= length:
                 result[ch] = name
             else:
-                exceeds = len(name.replace("-", "").replace("_", "")) \
+                exceeds = cell_width(name.replace("-", "").replace("_", "")) \
                     - length
                 words = re.split("[-_]", name)
                 chars_per_word = exceeds // len(words)
                 ch_name = []
-                exceeds2 = 0
                 for word in words:
-                    if len(word) > chars_per_word + 1:
-                        ch_name.append(word[:-(chars_per_word+1)])
-                    else:
-                        exceeds2 += len(word)
-                result[ch] = str.join("-", ch_name)
+                    width = cell_width(word)
+                    if width > chars_per_word + 1:
+                        ch_name.append(
+                            truncate(word, width - (chars_per_word + 1)))
+                result[ch] = truncate(str.join("-", ch_name), length)
     else:
         for ch in channels:
                 result[ch] = channel_name(ch)
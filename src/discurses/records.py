@@ -0,0 +1,78 @@
+"""Compact records of messages, as held by the message lists."""
+import sys
+
+from discord.utils import snowflake_time
+
+import discurses.processing as processing
+
+
+def _compact_markup(markup):
+    """A single string if there is no formatting, a tuple otherwise"""
+    if all(isinstance(part, str) for part in markup):
+        return "".join(markup)
+    return tuple(markup)
+
+
+class MessageRecord:
+    """
+    What the message list needs of a discord message, and nothing more.
+
+    The id is kept as an int, from which the timestamp is derived, the ids
+    and names of authors are interned, and the content is kept both raw,
+    for editing and quoting, and as rendered markup. The channel object is
+    referenced rather than copied, as it is shared by all its messages.
+    Records quack enough like a discord message to be edited or deleted.
+    """
+    __slots__ = ('id', 'channel', 'author_id', 'author_name', 'content',
+                 'markup', '_attachments')
+
+    def __init__(self, id, channel, author_id, author_name, content, markup,
+                 attachments=()):
+        self.id = id
+        self.channel = channel
+        self.author_id = author_id
+        self.author_name = author_name
+        self.content = content
+        self.markup = markup
+        self._attachments = attachments
+
+    @classmethod
+    def from_message(cls, message, user_id, matcher=None):
+        """
+        The record of a discord message, as seen by the user `user_id`,
+        with the matches of the highlight regex `matcher` highlighted
+        """
+        markup = processing.format_incomming(message, user_id, matcher)
+        for at in message.attachments:
+            markup.append("\n" + at.get('url'))
+        attachments = tuple((at.get('id'), at.get('filename'), at.get('url'),
+                             at.get('size')) for at in message.attachments)
+        return cls(int(message.id), message.channel,
+                   sys.intern(message.author.id),
+                   sys.intern(message.author.display_name),
+                   message.content, _compact_markup(markup), attachments)
+
+    @property
+    def timestamp(self):
+        return snowflake_time(self.id)
+
+    @property
+    def attachments(self):
+        return [{'id': id, 'filename': filename, 'url': url, 'size': size}
+                for id, filename, url, size in self._attachments]
+
+    @property
+    def clean_content(self):
+        """
+        The content as displayed, with mentions resolved, without the URLs
+        of the attachments
+        """
+        if isinstance(self.markup, str):
+            text = self.markup
+        else:
+            text = "".join(part if isinstance(part, str) else part[1]
+                           for part in self.markup)
+        urls = "".join("\n" + at[2] for at in self._attachments)
+        if urls and text.endswith(urls):
+            text = text[:-len(urls)]
+        return text
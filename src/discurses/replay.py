@@ -0,0 +1,170 @@
+"""
+Record and replay of discord sessions.
+
+A recording is a gzipped file with one JSON object per line. Gateway
+messages are stored exactly as they came off the websocket, REST
+responses are stored with the method and url of their request. Every line
+carries the number of seconds since the recording started.
+"""
+import asyncio
+import collections
+import gzip
+import json
+import logging
+import time
+import zlib
+
+import discurses.config as config
+from discurses.discord import DiscordClient
+from discurses.perf import max_rss_kb
+from discurses.ui.headless import HeadlessScreen
+
+logger = logging.getLogger(__name__)
+
+
+class Recorder:
+    """Writes the gateway stream and REST responses of a client to `path`"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path, 'wt', encoding='utf-8')
+        self.start = time.monotonic()
+        self.count = 0
+
+    def attach(self, client):
+        """Start recording everything `client` receives"""
+        request = client.http.request
+
+        async def recording_request(route, **kwargs):
+            data = await request(route, **kwargs)
+            self.rest(route.method, route.url, data)
+            return data
+
+        async def on_socket_raw_receive(msg):
+            if isinstance(msg, bytes):
+                msg = zlib.decompress(msg, 15, 10490000).decode('utf-8')
+            self.gateway(msg)
+
+        client.http.request = recording_request
+        client.on_socket_raw_receive = on_socket_raw_receive
+        logger.info("Recording session to %s", self.path)
+
+    def _elapsed(self):
+        return round(time.monotonic() - self.start, 6)
+
+    def gateway(self, raw):
+        """Record a raw gateway message, `raw` is the JSON text"""
+        self.file.write('{{"kind":"gateway","t":{0},"data":{1}}}\n'
+                        .format(self._elapsed(), raw))
+        self.count += 1
+
+    def rest(self, method, url, data):
+        self.file.write(json.dumps({
+            'kind': 'rest',
+            't': self._elapsed(),
+            'method': method,
+            'url': url,
+            'data': data,
+        }, separators=(',', ':')) + '\n')
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+        logger.info("Recorded %d entries to %s", self.count, self.path)
+
+
+def read_recording(path):
+    """
+    Read a recording.
+    Returns a list of `(t, data)` gateway messages and a dict mapping
+    `(method, url)` to a deque of REST responses, in recorded order.
+    """
+    gateway = []
+    rest = collections.defaultdict(collections.deque)
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        for line in file:
+            entry = json.loads(line)
+            if entry['kind'] == 'gateway':
+                gateway.append((entry['t'], entry['data']))
+            elif entry['kind'] == 'rest':
+                rest[(entry['method'], entry['url'])].append(entry['data'])
+    return gateway, rest
+
+
+class ReplayClient(DiscordClient):
+    """
+    A DiscordClient that is fed from a recording instead of the network.
+
+    The UI runs on a `HeadlessScreen`. `speed` is a multiplier of the
+    recorded pace, `0` replays as fast as possible.
+    """
+
+    def __init__(self, path, speed=1.0, *args, **kwargs):
+        super().__init__(*args, screen=HeadlessScreen(), warm_start=False,
+                         **kwargs)
+        self.path = path
+        self.speed = speed
+        self._rest = {}
+        self.http.request = self._replay_request
+        config.table['notify'] = False
+
+    async def login(self):
+        pass
+
+    async def _syncer(self, guilds):
+        pass
+
+    async def request_offline_members(self, server):
+        pass
+
+    async def send_ack(self, message):
+        pass
+
+    async def _replay_request(self, route, **kwargs):
+        responses = self._rest.get((route.method, route.url))
+        if responses:
+            return responses.popleft()
+        logger.warning("No recorded response for %s %s",
+                       route.method, route.url)
+        return [] if route.method == 'GET' else {}
+
+    def _feed(self, msg):
+        """Handle a gateway message the way the websocket would"""
+        self.dispatch('socket_response', msg)
+        if msg.get('op') != 0:
+            return
+        event = msg.get('t')
+        parser = getattr(self.connection, 'parse_' + event.lower(), None)
+        if parser is None:
+            logger.debug("Unhandled event in recording: %s", event)
+            return
+        parser(msg.get('d'))
+
+    async def replay(self):
+        gateway, self._rest = read_recording(self.path)
+        logger.info("Replaying %d gateway messages from %s at %sx",
+                    len(gateway), self.path, self.speed or 'max')
+        start = time.monotonic()
+        for t, msg in gateway:
+            delay = 0
+            if self.speed:
+                delay = t / self.speed - (time.monotonic() - start)
+            # Always yield, so the UI gets to draw even at max speed
+            await asyncio.sleep(max(delay, 0))
+            self._feed(msg)
+        elapsed = time.monotonic() - start
+        self.ui.draw_screen()
+        stats = {
+            'messages': len(gateway),
+            'seconds': round(elapsed, 3),
+            'messages_per_second': round(len(gateway) / elapsed, 1)
+            if elapsed else None,
+            'frames': self.screen.frames,
+            'max_rss_kb': max_rss_kb(),
+        }
+        logger.info("Replay finished: %s", stats)
+        return stats
+
+    def run(self):
+        stats = self.loop.run_until_complete(self.replay())
+        print(json.dumps(stats))
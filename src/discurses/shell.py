@@ -0,0 +1,100 @@
+"""Shell commands run without blocking the event loop."""
+import asyncio
+import codecs
+import os
+import signal
+
+import discurses.config as config
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ShellCommand:
+    """
+    Runs `command` in a shell, with stdout and stderr captured together.
+
+    `on_output(text)` is called as output arrives and `on_exit(status)` when
+    the command is over. It is killed, along with the processes it started,
+    when it runs for more than `timeout` seconds or outputs more than
+    `max_bytes`. It runs as a task of `discord_client` in `scope`.
+    """
+
+    CHUNK_SIZE = 4096
+
+    def __init__(self, command, on_output, on_exit, discord_client,
+                 scope=None, timeout=None, max_bytes=None):
+        if timeout is None:
+            timeout = config.table.get('shell_timeout', 30)
+        if max_bytes is None:
+            max_bytes = config.table.get('shell_max_bytes', 64 * 1024)
+        self.command = command
+        self.on_output = on_output
+        self.on_exit = on_exit
+        self.discord = discord_client
+        self.scope = scope
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.chunks = []
+        self.size = 0
+        self.status = "running"
+        self.process = None
+        self.task = None
+
+    @property
+    def output(self):
+        return "".join(self.chunks)
+
+    def start(self):
+        self.task = self.discord.async_do(self._run(), name="shell",
+                                          scope=self.scope)
+        return self
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    async def _read(self):
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        while True:
+            chunk = await self.process.stdout.read(self.CHUNK_SIZE)
+            if not chunk:
+                text = decoder.decode(b'', final=True)
+            else:
+                chunk = chunk[:self.max_bytes - self.size]
+                self.size += len(chunk)
+                text = decoder.decode(chunk)
+            if text:
+                self.chunks.append(text)
+                self.on_output(text)
+            if not chunk:
+                return "exit {0}".format(await self.process.wait())
+            if self.size >= self.max_bytes:
+                return "truncated"
+
+    async def _run(self):
+        try:
+            self.process = await asyncio.create_subprocess_shell(
+                self.command, stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT, start_new_session=True)
+            self.status = await asyncio.wait_for(self._read(), self.timeout)
+        except asyncio.TimeoutError:
+            self.status = "timed out"
+        except asyncio.CancelledError:
+            self.status = "cancelled"
+        except OSError as e:
+            self.status = str(e)
+        finally:
+            if self.process is not None and self.process.returncode is None:
+                self._kill()
+            logger.info("Shell command %r: %s", self.command, self.status)
+            self.on_exit(self.status)
+
+    def _kill(self):
+        # The shell leads a process group of the commands it started
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
@@ -0,0 +1,161 @@
+"""
+Warm start.
+
+On exit the open tabs and the server metadata needed to render them are
+saved to a compact snapshot. On the next start the UI is rebuilt from it
+right away, using the stand-ins below for the discord objects, and the
+tabs are reconciled with the real objects once READY arrives.
+"""
+import gzip
+import json
+import os
+
+import discord
+
+import discurses.config as config
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = os.path.join(config.CACHE_DIR_PATH, "session.json.gz")
+SNAPSHOT_VERSION = 1
+
+# Members of a server kept in the snapshot, for the member list
+MAX_MEMBERS = 1000
+
+
+class SnapshotMember:
+    def __init__(self, id, name, nick=None):
+        self.id = id
+        self.name = name
+        self.display_name = nick or name
+        self.status = discord.Status.offline
+        self.roles = []
+
+
+class SnapshotRole:
+    def __init__(self, id, name, colour):
+        self.id = id
+        self.name = name
+        self.colour = discord.Colour(colour)
+
+
+class SnapshotServer:
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+        self.channels = []
+        self.roles = []
+        self.members = []
+
+
+class SnapshotChannel:
+    def __init__(self, id, name, type, server=None, recipients=()):
+        self.id = id
+        self.name = name
+        self.type = discord.ChannelType(type)
+        self.server = server
+        self.is_private = server is None
+        self.recipients = [SnapshotMember(None, r) for r in recipients]
+        self.user = self.recipients[0] if self.recipients else None
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class Snapshot:
+    """The servers, private channels and tabs of a saved session"""
+
+    def __init__(self, data):
+        self.current_tab = data.get('current_tab')
+        self.channels = {}
+        self.servers = []
+        for sd in data.get('servers', []):
+            server = SnapshotServer(sd['id'], sd['name'])
+            server.roles = [SnapshotRole(*r) for r in sd.get('roles', [])]
+            server.members = [SnapshotMember(*m)
+                              for m in sd.get('members', [])]
+            for cd in sd.get('channels', []):
+                ch = SnapshotChannel(cd[0], cd[1], cd[2], server=server)
+                server.channels.append(ch)
+                self.channels[ch.id] = ch
+            self.servers.append(server)
+        self.private_channels = []
+        for cd in data.get('private_channels', []):
+            ch = SnapshotChannel(cd[0], cd[1], cd[2], recipients=cd[3])
+            self.private_channels.append(ch)
+            self.channels[ch.id] = ch
+        self.tabs = {}
+        for td in data.get('tabs', []):
+            td['channels'] = [self.channels[c] for c in td['channels']
+                              if c in self.channels]
+            td['send_channel'] = self.channels.get(td['send_channel'])
+            self.tabs[td.pop('index')] = td
+
+
+def _channel_type(ch):
+    return getattr(ch.type, 'value', ch.type)
+
+
+def _serialize_server(server, with_members):
+    data = {
+        'id': server.id,
+        'name': server.name,
+        'channels': [[ch.id, ch.name, _channel_type(ch)]
+                     for ch in server.channels],
+    }
+    if with_members:
+        data['roles'] = [[r.id, r.name, r.colour.value]
+                         for r in server.roles]
+        data['members'] = [[m.id, m.name, getattr(m, 'nick', None)]
+                           for m in list(server.members)[:MAX_MEMBERS]]
+    return data
+
+
+def _serialize_private_channel(ch):
+    return [ch.id, ch.name, _channel_type(ch),
+            [u.display_name for u in ch.recipients]]
+
+
+def save(ui, path=SNAPSHOT_PATH):
+    tabs = []
+    shown_servers = set()
+    for index, tab in ui.tabs.items():
+        tab_data = tab.snapshot()
+        tab_data['index'] = index
+        tabs.append(tab_data)
+        shown_servers.update(ch.server.id for ch in tab.channels
+                             if not ch.is_private)
+    data = {
+        'version': SNAPSHOT_VERSION,
+        'current_tab': ui.current_tab,
+        'tabs': tabs,
+        'servers': [_serialize_server(s, s.id in shown_servers)
+                    for s in ui.get_servers()],
+        'private_channels': [_serialize_private_channel(ch)
+                             for ch in ui.get_private_channels()],
+    }
+    tmp = path + ".tmp"
+    with gzip.open(tmp, 'wt', encoding='utf-8') as file:
+        json.dump(data, file, separators=(',', ':'))
+    os.replace(tmp, path)
+    logger.info("Saved snapshot of %d tabs", len(tabs))
+
+
+def load(path=SNAPSHOT_PATH):
+    """Load the snapshot, or `None` if there is no usable one"""
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            data = json.load(file)
+        if data.get('version') != SNAPSHOT_VERSION:
+            return None
+        return Snapshot(data)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError):
+        logger.exception("Could not load the snapshot")
+        return None
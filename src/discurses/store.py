@@ -0,0 +1,247 @@
+"""The messages of channels, shared by every tab showing them."""
+import collections
+
+import discurses.config as config
+from discurses.records import MessageRecord
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelHistory:
+    """The messages of a channel in the MessageStore"""
+    __slots__ = ('records', 'views', 'latest', 'oldest', 'exhausted')
+
+    def __init__(self):
+        # Snowflake id -> MessageRecord
+        self.records = {}
+        # The views referencing the channel
+        self.views = []
+        # Whether every message from the newest one down to `oldest` is
+        # in `records`. Messages older than that may be too, such as
+        # those around a message jumped to.
+        self.latest = False
+        self.oldest = None
+        # Whether there are no messages older than `oldest`
+        self.exhausted = False
+
+    def contiguous(self, before=None):
+        """The ids of the contiguous messages older than `before`, newest
+        first"""
+        if not self.latest:
+            return []
+        return sorted((i for i in self.records
+                       if (self.oldest is None or i >= self.oldest) and
+                       (before is None or i < before)), reverse=True)
+
+
+class MessageStore:
+    """
+    The messages of channels keyed by channel and snowflake id.
+
+    Message lists are views onto the store: a view acquires the channels
+    it shows and releases them when it stops showing them. Every message
+    is formatted once, and edits and deletes are applied once before they
+    are passed on to the views of the channel, as `message_added(record)`,
+    `message_edited(record)` and `message_deleted(record)`.
+
+    Pages of history are shared, so that a channel shown in several tabs
+    is loaded once. A channel is kept as long as a view references it.
+    Of the rest, such as prefetched channels, the latest `KEEP` messages
+    of the `max_channels` most recently used are kept.
+    """
+
+    KEEP = 50
+
+    def __init__(self, discord_client, max_channels=None):
+        if max_channels is None:
+            max_channels = config.table.get('prefetch_cache_channels', 50)
+        self.discord = discord_client
+        self.max_channels = max_channels
+        # Channel id -> ChannelHistory, least recently used first
+        self.channels = collections.OrderedDict()
+        discord_client.add_event_handler('on_message', self._on_message)
+        discord_client.add_event_handler('on_message_edit',
+                                         self._on_message_edit)
+        discord_client.add_event_handler('on_message_delete',
+                                         self._on_message_delete)
+        discord_client.add_event_handler('on_resumed', self._on_resumed)
+
+    def __contains__(self, channel_id):
+        """Whether the latest messages of a channel are in the store"""
+        history = self.channels.get(channel_id)
+        return history is not None and history.latest
+
+    def _history(self, channel_id):
+        history = self.channels.get(channel_id)
+        if history is None:
+            history = self.channels[channel_id] = ChannelHistory()
+        self.channels.move_to_end(channel_id)
+        return history
+
+    def acquire(self, channel_id, view):
+        """Keep the messages of a channel for `view`"""
+        history = self._history(channel_id)
+        if view not in history.views:
+            history.views.append(view)
+
+    def release(self, channel_id, view):
+        """`view` no longer shows a channel"""
+        history = self.channels.get(channel_id)
+        if history is None or view not in history.views:
+            return
+        history.views.remove(view)
+        if len(history.views) == 0:
+            self._trim(channel_id, history)
+            self._evict()
+
+    def discard(self, channel_id):
+        """Forget what is known of the history of a channel, keeping the
+        messages its views still show"""
+        history = self.channels.get(channel_id)
+        if history is None:
+            return
+        if len(history.views) == 0:
+            del self.channels[channel_id]
+        else:
+            history.latest = False
+            history.exhausted = False
+
+    def _trim(self, channel_id, history):
+        """Keep only the latest messages of a channel no view shows"""
+        if not history.latest:
+            del self.channels[channel_id]
+            return
+        ids = history.contiguous()
+        keep = ids[:self.KEEP]
+        history.records = {i: history.records[i] for i in keep}
+        if len(ids) > self.KEEP:
+            history.oldest = keep[-1]
+            history.exhausted = False
+
+    def _evict(self):
+        unused = [channel_id for channel_id, history in self.channels.items()
+                  if len(history.views) == 0]
+        for channel_id in unused[:max(0, len(unused) - self.max_channels)]:
+            del self.channels[channel_id]
+
+    def record(self, message):
+        """
+        The record of `message`, a discord message or a record. It is
+        shared if the channel is in the store, and made afresh otherwise.
+        """
+        history = self.channels.get(message.channel.id)
+        if history is None:
+            if isinstance(message, MessageRecord):
+                return message
+            return self._from_message(message)
+        return self._add(history, message)
+
+    def _from_message(self, message):
+        client = self.discord.client_for(message.channel)
+        return MessageRecord.from_message(message, client.user.id,
+                                          client.rules.matcher)
+
+    def _add(self, history, message):
+        record = history.records.get(int(message.id))
+        if record is None:
+            if isinstance(message, MessageRecord):
+                record = message
+            else:
+                record = self._from_message(message)
+            history.records[record.id] = record
+        return record
+
+    def add(self, messages):
+        """The shared records of `messages`, adding the new ones"""
+        return [self.record(m) for m in messages]
+
+    def page(self, channel_id, before, limit):
+        """
+        Up to `limit` of the messages of a channel older than the snowflake
+        id `before`, or than none if None, without a request, and whether
+        they are the last ones. None if they have to be requested.
+        """
+        history = self.channels.get(channel_id)
+        if history is None:
+            return None
+        ids = history.contiguous(before)
+        if len(ids) == 0 and not (history.latest and history.exhausted):
+            return None
+        self.channels.move_to_end(channel_id)
+        return ([history.records[i] for i in ids[:limit]],
+                history.exhausted and len(ids) <= limit)
+
+    def add_page(self, channel_id, before, messages, exhausted):
+        """
+        Add a page of `messages` requested from the messages of a channel
+        older than the snowflake id `before`, or than none if None, and
+        return their records. `exhausted` if there are no older ones.
+        """
+        history = self._history(channel_id)
+        records = [self._add(history, m) for m in messages]
+        if before is None:
+            contiguous = True
+            if not history.latest:
+                history.oldest = None
+            history.latest = True
+        else:
+            contiguous = history.latest and (history.oldest is None or
+                                             before >= history.oldest)
+        if contiguous:
+            if len(records) > 0:
+                oldest = min(r.id for r in records)
+                if history.oldest is not None:
+                    oldest = min(oldest, history.oldest)
+                history.oldest = oldest
+            history.exhausted = history.exhausted or exhausted
+        self._evict()
+        return records
+
+    def _on_message(self, message):
+        history = self.channels.get(message.channel.id)
+        if history is None:
+            return
+        if len(history.views) == 0:
+            # Only the latest messages of a channel no view shows are kept
+            if not history.latest:
+                return
+            self._add(history, message)
+            if len(history.records) > self.KEEP:
+                self._trim(message.channel.id, history)
+            return
+        record = self._add(history, message)
+        for view in list(history.views):
+            view.message_added(record)
+
+    def _on_message_edit(self, before, after):
+        history = self.channels.get(before.channel.id)
+        if history is None or int(before.id) not in history.records:
+            return
+        record = history.records[int(before.id)] = self._from_message(after)
+        for view in list(history.views):
+            view.message_edited(record)
+
+    def _on_message_delete(self, message):
+        history = self.channels.get(message.channel.id)
+        if history is None:
+            return
+        record = history.records.pop(int(message.id), None)
+        if record is None:
+            return
+        for view in list(history.views):
+            view.message_deleted(record)
+
+    def _on_resumed(self, client):
+        # Messages may have been missed in the channels of `client`. The
+        # views backfill what they show, the rest is loaded afresh.
+        for channel_id, history in list(self.channels.items()):
+            channel = self.discord.get_channel(channel_id)
+            if channel is not None and not client.dispatches(channel):
+                continue
+            if len(history.views) == 0:
+                del self.channels[channel_id]
+            else:
+                history.latest = False
+                history.exhausted = False
@@ -0,0 +1,97 @@
+"""Supervision of the tasks started by the client."""
+import asyncio
+import enum
+import inspect
+
+import discurses.config as config
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(enum.Enum):
+    # Started right away, the user is waiting for it
+    INTERACTIVE = enum.auto()
+    # Queued behind the other background tasks
+    BACKGROUND = enum.auto()
+
+
+def _close_unstarted(coro):
+    """Close `coro` if it never ran, so that it is not reported as never
+    awaited"""
+    if inspect.getcoroutinestate(coro) == inspect.CORO_CREATED:
+        coro.close()
+
+
+class TaskSupervisor:
+    """
+    Keeps track of running tasks.
+
+    A task can be given a `scope`, usually the tab it belongs to, and a
+    `name` that is unique within its scope: starting a task supersedes the
+    running one with the same name and scope, and all tasks of a scope can
+    be cancelled at once. Background tasks run at most `background` at a
+    time. Failures are logged and dispatched as `on_task_error` with the
+    scope, name and exception.
+    """
+
+    def __init__(self, discord_client, background=None):
+        if background is None:
+            background = config.table.get('background_tasks', 2)
+        self.discord = discord_client
+        self.background = asyncio.Semaphore(background)
+        self.tasks = {}
+
+    def spawn(self, coro, name=None, scope=None,
+              priority=Priority.INTERACTIVE):
+        key = (scope, name if name is not None else object())
+        previous = self.tasks.get(key)
+        if previous is not None:
+            logger.debug("Superseding task %s", name)
+            previous.cancel()
+        if priority is Priority.BACKGROUND:
+            queued = coro
+            coro = self._in_background(queued)
+            task = self.discord.loop.create_task(coro)
+            # Cancelled before the task even started
+            task.add_done_callback(lambda t: _close_unstarted(queued))
+        else:
+            task = self.discord.loop.create_task(coro)
+        self.tasks[key] = task
+        task.add_done_callback(lambda t: self._done(key, t))
+        return task
+
+    async def _in_background(self, coro):
+        try:
+            async with self.background:
+                return await coro
+        finally:
+            # Cancelled while queued
+            _close_unstarted(coro)
+
+    def cancel(self, scope, name):
+        task = self.tasks.get((scope, name))
+        if task is not None:
+            task.cancel()
+
+    def cancel_scope(self, scope):
+        """Cancel every task of `scope`"""
+        for (task_scope, _name), task in list(self.tasks.items()):
+            if task_scope is scope:
+                task.cancel()
+
+    def _done(self, key, task):
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
+        if task.cancelled():
+            return
+        e = task.exception()
+        if e is None:
+            return
+        scope, name = key
+        if not isinstance(name, str):
+            name = None
+        logger.error("Task %s failed", name or "", exc_info=e)
+        for f in self.discord.event_handlers['on_task_error']:
+            f(scope, name, e)
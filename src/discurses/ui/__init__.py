@@ -8,4 +8,5 @@ from discurses.ui.statusbar import Statusbar
 from discurses.ui.server_tree import ServerTree
 from discurses.ui.has_modal import HasModal
 from discurses.ui.chat import ChatWindow
+from discurses.ui.hibernation import HibernatedTab
 from discurses.ui.main import MainUI, TabSelector
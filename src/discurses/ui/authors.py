@@ -0,0 +1,144 @@
+"""How the authors of messages are shown."""
+from discurses.width import cell_width, truncate
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The foreground colours of 16 colour terminals, to approximate role
+# colours with
+BASIC_COLOURS = [
+    ("dark red", (128, 0, 0)),
+    ("dark green", (0, 128, 0)),
+    ("brown", (128, 128, 0)),
+    ("dark blue", (0, 0, 128)),
+    ("dark magenta", (128, 0, 128)),
+    ("dark cyan", (0, 128, 128)),
+    ("light gray", (192, 192, 192)),
+    ("dark gray", (128, 128, 128)),
+    ("light red", (255, 0, 0)),
+    ("light green", (0, 255, 0)),
+    ("yellow", (255, 255, 0)),
+    ("light blue", (0, 0, 255)),
+    ("light magenta", (255, 0, 255)),
+    ("light cyan", (0, 255, 255)),
+    ("white", (255, 255, 255)),
+]
+
+
+def basic_colour(rgb):
+    """The basic colour closest to `rgb`"""
+    return min(BASIC_COLOURS, key=lambda c: sum(
+        (a - b) ** 2 for a, b in zip(c[1], rgb)))[0]
+
+
+class AuthorStyle:
+    """How an author is shown in a server"""
+    __slots__ = ('name', 'attr', 'roles', 'width', '_labels')
+
+    def __init__(self, name, attr, roles=frozenset()):
+        self.name = name
+        self.attr = attr
+        # Ids of the roles of the author, to tell which role changes
+        # affect them
+        self.roles = roles
+        self.width = cell_width(name)
+        # Width -> label
+        self._labels = {}
+
+    def label(self, width):
+        """The name and a colon, truncated to `width` cells"""
+        label = self._labels.get(width)
+        if label is None:
+            label = truncate(self.name, width - 1) + ":"
+            self._labels[width] = label
+        return label
+
+
+class AuthorCache:
+    """
+    The AuthorStyle of every author shown, per server: the display name,
+    the colour of the top coloured role as a palette entry, the width of
+    the name in cells and its labels truncated to the widths asked for.
+
+    Entries are dropped when the member or one of their roles is updated,
+    after which `on_author_update(server_id, author_ids)` is dispatched.
+    """
+
+    def __init__(self, ui):
+        self.ui = ui
+        self.discord = ui.discord
+        # (server id, author id) -> AuthorStyle
+        self.styles = {}
+        # Palette entries registered for role colours
+        self.attrs = set()
+        self.discord.add_event_handler('on_member_update',
+                                       self._on_member_update)
+        self.discord.add_event_handler('on_member_remove',
+                                       self._on_member_remove)
+        self.discord.add_event_handler('on_server_role_update',
+                                       self._on_role_update)
+        self.discord.add_event_handler('on_server_role_delete',
+                                       self._on_role_delete)
+
+    def get(self, record):
+        """The AuthorStyle of the author of `record`"""
+        server = None if record.channel.is_private else record.channel.server
+        key = (server and server.id, record.author_id)
+        style = self.styles.get(key)
+        if style is None:
+            member = server and server.get_member(record.author_id)
+            if member is None:
+                style = AuthorStyle(record.author_name, "message_author")
+            else:
+                style = AuthorStyle(
+                    member.display_name, self.attr(member.colour),
+                    frozenset(role.id for role in member.roles))
+            self.styles[key] = style
+        return style
+
+    def attr(self, colour):
+        """The palette entry of a discord colour"""
+        if colour.value == 0:
+            return "message_author"
+        name = "message_author_{0:06x}".format(colour.value)
+        if name not in self.attrs:
+            rgb = colour.to_tuple()
+            basic = basic_colour(rgb)
+            high = "#" + "".join("{0:x}".format(c >> 4) for c in rgb)
+            screen = self.ui.urwid_loop.screen
+            screen.register_palette_entry(
+                name, basic, "default", None, high, "default")
+            screen.register_palette_entry(
+                name + "_f", basic + ",standout", "default", None,
+                high + ",standout", "default")
+            self.ui.focus_attr[name] = name + "_f"
+            self.attrs.add(name)
+        return name
+
+    def _drop(self, server_id, author_ids):
+        for author_id in author_ids:
+            self.styles.pop((server_id, author_id), None)
+        if author_ids:
+            for f in self.discord.event_handlers['on_author_update']:
+                f(server_id, author_ids)
+
+    def _on_member_update(self, before, after):
+        # Most updates are of the presence, which is not shown here
+        if before.display_name != after.display_name or \
+                before.roles != after.roles:
+            self._drop(after.server.id, [after.id])
+
+    def _on_member_remove(self, member):
+        self._drop(member.server.id, [member.id])
+
+    def _on_role_update(self, before, after):
+        if before.colour != after.colour or \
+                before.position != after.position:
+            self._on_role_delete(after)
+
+    def _on_role_delete(self, role):
+        self._drop(role.server.id, [
+            author_id for (server_id, author_id), style
+            in self.styles.items()
+            if server_id == role.server.id and role.id in style.roles])
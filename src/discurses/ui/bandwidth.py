@@ -0,0 +1,99 @@
+"""Keeping terminal output down, for slow links."""
+import collections
+import time
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class OutputMeter:
+    """Counts the draws of a screen and the bytes it writes"""
+
+    # Seconds the current rate is measured over
+    WINDOW = 5
+
+    def __init__(self):
+        self.bytes = 0
+        self.draws = 0
+        # (time, bytes) of the latest writes
+        self.recent = collections.deque()
+
+    def attach(self, screen):
+        """
+        Start counting the draws of `screen`, and the bytes it writes if it
+        writes to a terminal
+        """
+        draw_screen = screen.draw_screen
+
+        def metered_draw_screen(size, canvas):
+            self.draws += 1
+            draw_screen(size, canvas)
+
+        screen.draw_screen = metered_draw_screen
+        if not hasattr(screen, 'write'):
+            return
+        write = screen.write
+
+        def metered_write(data):
+            if isinstance(data, str):
+                self.add(len(data.encode('utf-8', 'replace')))
+            else:
+                self.add(len(data))
+            write(data)
+
+        screen.write = metered_write
+
+    def add(self, n):
+        now = time.monotonic()
+        self.bytes += n
+        self.recent.append((now, n))
+        while self.recent[0][0] < now - self.WINDOW:
+            self.recent.popleft()
+
+    def rate(self):
+        """Bytes per second written lately"""
+        now = time.monotonic()
+        return sum(n for t, n in self.recent
+                   if t >= now - self.WINDOW) / self.WINDOW
+
+
+class DrawThrottle:
+    """
+    Batches the draws asked for into one every `interval` seconds, and
+    holds them back further while more than `rate` bytes a second have
+    been written, allowing bursts of up to a second's worth.
+    """
+
+    def __init__(self, urwid_loop, meter, rate, interval=0.5):
+        self.urwid_loop = urwid_loop
+        self.meter = meter
+        self.rate = rate
+        self.interval = interval
+        self.tokens = rate
+        self.counted = meter.bytes
+        self.updated = time.monotonic()
+        self.drawn = 0
+        self._handle = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.tokens -= self.meter.bytes - self.counted
+        self.counted = self.meter.bytes
+        self.updated = now
+
+    def request(self):
+        """Draw the screen soon"""
+        if self._handle is not None:
+            return
+        self._refill()
+        delay = max(0, self.interval - (time.monotonic() - self.drawn),
+                    -self.tokens / self.rate)
+        self._handle = self.urwid_loop.set_alarm_in(delay, self._draw)
+
+    def _draw(self, _loop, _data):
+        self._handle = None
+        self.drawn = time.monotonic()
+        self.urwid_loop.draw_screen()
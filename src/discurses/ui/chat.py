@@ -1,15 +1,16 @@
 import enum
-import os
 
 import urwid
 
 import discurses.config
 import discurses.keymaps as keymaps
 import discurses.processing
+from discurses.uploads import UploadError
 from discurses.ui import (HasModal, MessageEditWidget, MessageListWidget,
                           SendChannelSelector, ServerTree, Statusbar)
 
 from discurses.ui.member_list import MemberList
+from discurses.ui.shell_output import ShellOutputWidget
 
 
 class ChatWindow(urwid.WidgetWrap, HasModal):
@@ -29,7 +30,8 @@ class ChatWindow(urwid.WidgetWrap, HasModal):
         SERVER_TREE = enum.auto()
         STATUSBAR = enum.auto()
 
-    def __init__(self, discord_client, channels, send_channel, name):
+    def __init__(self, discord_client, channels, send_channel, name,
+                 messages=None, cursor=None):
         self.discord = discord_client
         self.channels = channels
         self.send_channel = send_channel
@@ -40,7 +42,8 @@ class ChatWindow(urwid.WidgetWrap, HasModal):
 
         # Public widgets
         self.w_channel_selector = SendChannelSelector(self)
-        self.w_message_list = MessageListWidget(self.discord, self)
+        self.w_message_list = MessageListWidget(self.discord, self,
+                                                messages, cursor)
         self.w_message_edit = MessageEditWidget(self.discord, self)
         self.w_member_list = MemberList(self)
         self.w_server_tree = ServerTree(self)
@@ -55,6 +58,7 @@ class ChatWindow(urwid.WidgetWrap, HasModal):
         HasModal.__init__(self, self._w_layout)
         urwid.WidgetWrap.__init__(self, self._w_placeholder)
         self.set_focus(ChatWindow.FocusTarget.SERVER_TREE)
+        self.discord.add_event_handler('on_task_error', self._on_task_error)
 
     def _setup_layout(self):
         """
@@ -68,12 +72,7 @@ class ChatWindow(urwid.WidgetWrap, HasModal):
              ])
 
         self._w_layout = self._w_pile
-        self._w_server_tree_column = urwid.LineBox(
-                    self.w_server_tree,
-                    tlcorner='', tline='',
-                    lline='', trcorner='│',
-                    blcorner='', rline='│',
-                    bline='', brcorner='│')
+        self._w_server_tree_column = self._server_tree_column()
         self._w_member_list_column = urwid.LineBox(
                     self.w_member_list,
                     tlcorner='│', tline='',
@@ -82,6 +81,14 @@ class ChatWindow(urwid.WidgetWrap, HasModal):
                     bline='', brcorner='')
         self._refresh_layout()
 
+    def _server_tree_column(self):
+        return urwid.LineBox(
+                    self.w_server_tree,
+                    tlcorner='', tline='',
+                    lline='', trcorner='│',
+                    blcorner='', rline='│',
+                    bline='', brcorner='│')
+
     def _refresh_layout(self):
         """
         Refresh sidebar visibility changes
@@ -100,7 +107,8 @@ class ChatWindow(urwid.WidgetWrap, HasModal):
                             self._w_columns.options('weight', 0.25)))
 
         self._w_columns.contents = columns
-        if focus_before is not None:
+        # The focused column may have been hidden or replaced
+        if focus_before in [w for w, _options in columns]:
             self._w_columns.set_focus(focus_before)
         else:
             self._w_columns.focus_position = 0
@@ -110,10 +118,6 @@ class ChatWindow(urwid.WidgetWrap, HasModal):
         """Forward keypresses to the wrapped widget"""
         return self._w.keypress(size, key)
 
-    @keymaps.GLOBAL.command
-    def redraw(self):
-        self.channel_list_updated()
-
     @keymaps.CHAT.command
     def focus_up(self):
         if self._w_pile.focus_position > 0:
@@ -158,27 +162,63 @@ class ChatWindow(urwid.WidgetWrap, HasModal):
     @keymaps.CHAT.command
     def ask_shell_command(self):
         def _callback(txt):
-            if txt is not None:
-                self.edit_message.edit.insert_text("```\n" + os.popen(
-                    txt).read() + "\n```")
             self.close_pop_up()
+            if txt:
+                w = ShellOutputWidget(self, txt)
+                self.open_pop_up(w, header=urwid.Text("$ " + txt),
+                                 footer=w.w_status,
+                                 height=('relative', 80),
+                                 width=('relative', 80))
 
         self.open_text_prompt(_callback, "Send results of command")
 
+    @keymaps.CHAT.command
+    def ask_jump(self):
+        def _callback(txt):
+            self.close_pop_up()
+            if not txt:
+                return
+            snowflake = discurses.processing.parse_snowflake(txt)
+            if snowflake is None:
+                self.w_statusbar.echo("Not a message id or date: {0}", txt)
+                return
+            self.w_message_list.jump_to(snowflake)
+            self.set_focus(ChatWindow.FocusTarget.MESSAGE_LIST)
+
+        self.open_text_prompt(_callback, "Jump to message id or date")
+
     @keymaps.CHAT.command
     def ask_send_file(self):
         def _callback(path):
             def _callback2(txt):
                 self.close_pop_up()
-                self.discord.async_do(
-                    self.discord.send_file(
-                        destination=self.send_channel, fp=path, content=txt))
+                if txt is None:
+                    return
+                try:
+                    self.discord.uploads.upload(
+                        self, self.send_channel, path, content=txt or None,
+                        progress=self._upload_progress)
+                except (UploadError, OSError) as e:
+                    self.w_statusbar.echo(str(e))
 
             self.open_text_prompt(_callback2, "Message contents",
-                                  self.edit_message.edit.edit_text)
+                                  self.w_message_edit.edit.edit_text)
 
         discurses.config.file_picker(_callback, self)
 
+    @keymaps.CHAT.command
+    def cancel_upload(self):
+        upload = self.discord.uploads.cancel(self)
+        if upload is not None:
+            self.w_statusbar.echo("Cancelling upload of {0}",
+                                  upload.filename)
+
+    def _upload_progress(self, upload):
+        uploads = [u for u in self.discord.uploads.uploads if u.owner is self]
+        self.w_statusbar.set_progress(" ".join(u.describe() for u in uploads))
+        if upload.status not in ("queued", "uploading", "done"):
+            self.w_statusbar.echo(upload.describe())
+
     @keymaps.CHAT.command
     def refetch_messages(self):
         self.w_message_list.list_walker.invalidate()
@@ -207,16 +247,86 @@ class ChatWindow(urwid.WidgetWrap, HasModal):
         self.channel_names = discurses.processing.shorten_channel_names(
             self.channels, 14)
         if get_logs:
-            self.refetch_messages()
+            self.w_message_list.list_walker.update_channels()
+        if self.ui.tabs.get(self.ui.current_tab) is self:
+            self.mark_read()
         self.w_member_list.update_list()
         self.w_channel_selector.update_columns()
         self.w_message_edit.update_text()
 
+    def _on_task_error(self, scope, name, e):
+        if scope is self or (scope is None and
+                             self.ui.tabs.get(self.ui.current_tab) is self):
+            self.w_statusbar.echo("{0} failed: {1}", name or "Task", e)
+
     def set_send_channel(self, channel):
         self.send_channel = channel
-        self.w_message_list.update_all_columns()
+        if not self.ui.low_bandwidth:
+            # Repaints every row, to show which are of the send channel
+            self.w_message_list.update_all_columns()
         self.w_channel_selector.update_columns()
         self.w_message_edit.update_text()
 
     def set_name(self, name):
         self.name = name
+
+    def mark_read(self):
+        """
+        Mark the channels as read.
+        Where the unread messages start is marked in the message list.
+        """
+        unread = self.discord.unread
+        marker = None
+        for ch in self.channels:
+            entry = unread.channels.get(ch.id)
+            if entry is not None and entry.unread > 0 and \
+                    entry.last_read_id is not None:
+                if marker is None or int(entry.last_read_id) < int(marker):
+                    marker = entry.last_read_id
+            unread.mark_read(ch.id)
+        if marker is not None:
+            self.w_message_list.set_new_messages_marker(marker)
+
+    def snapshot(self):
+        """The state of the window to save for a warm start"""
+        return {
+            'name': self.name,
+            'channels': [ch.id for ch in self.channels],
+            'send_channel': self.send_channel and self.send_channel.id,
+            'cursor': self.w_message_list.focused_message_id(),
+            'show_member_list': self.show_member_list,
+            'show_server_tree': self.show_server_tree,
+        }
+
+    def reconcile(self):
+        """
+        Replace the channels restored from a snapshot with the real ones,
+        and fetch everything that could not be restored.
+        """
+        self.channels[:] = [ch for ch in map(
+            lambda ch: self.discord.get_channel(ch.id), self.channels)
+            if ch is not None]
+        if self.send_channel is not None:
+            self.send_channel = self.discord.get_channel(self.send_channel.id)
+        if self.send_channel is None and len(self.channels) > 0:
+            self.send_channel = self.channels[0]
+        was_focused = self._w_columns.focus is self._w_server_tree_column
+        self.discord.remove_event_handlers(self.w_server_tree)
+        self.w_server_tree = ServerTree(self)
+        self._w_server_tree_column = self._server_tree_column()
+        self._refresh_layout()
+        if was_focused:
+            self.set_focus(ChatWindow.FocusTarget.SERVER_TREE)
+        self.channel_list_updated()
+
+    def close(self):
+        """
+        Stop reacting to events and timers.
+        Called when the window is discarded.
+        """
+        for w in (self, self.w_message_list, self.w_member_list,
+                  self.w_server_tree, self.w_statusbar.w_typing):
+            self.discord.remove_event_handlers(w)
+        self.discord.tasks.cancel_scope(self)
+        self.w_message_list.close()
+        self.w_statusbar.w_typing.stop()
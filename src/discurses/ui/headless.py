@@ -0,0 +1,48 @@
+import urwid
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class HeadlessScreen(urwid.BaseScreen):
+    """
+    A screen without a terminal.
+
+    Canvases are still fully rendered on every draw, so the cost of
+    a frame is the same as on a real terminal minus the output itself.
+    """
+
+    def __init__(self, size=(160, 50)):
+        super().__init__()
+        self.size = size
+        self.frames = 0
+
+    def get_cols_rows(self):
+        return self.size
+
+    def draw_screen(self, size, canvas):
+        for _row in canvas.content():
+            pass
+        self.frames += 1
+
+    def clear(self):
+        pass
+
+    def set_mouse_tracking(self, enable=True):
+        pass
+
+    def set_input_timeouts(self, *args, **kwargs):
+        pass
+
+    def get_input_descriptors(self):
+        return []
+
+    def get_input_nonblocking(self):
+        return None, [], []
+
+    def hook_event_loop(self, event_loop, callback):
+        pass
+
+    def unhook_event_loop(self, event_loop):
+        pass
@@ -0,0 +1,113 @@
+import collections
+
+import discurses.config as config
+from discurses.ui.chat import ChatWindow
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class HibernatedTab:
+    """
+    A tab that has been in the background for a while.
+
+    It holds no widgets, only what is needed to rebuild its ChatWindow: the
+    channels, the focused message and the latest messages of its channels.
+    Unread messages are counted by the client's UnreadIndex.
+    """
+
+    def __init__(self, discord_client, name, channels, send_channel,
+                 messages=(), cursor=None, show_member_list=True,
+                 show_server_tree=True):
+        self.discord = discord_client
+        self.name = name
+        self.channels = channels
+        self.send_channel = send_channel
+        self.messages = collections.deque(
+            messages, maxlen=config.table.get('hibernate_cache_size', 200))
+        self.cursor = cursor
+        self.show_member_list = show_member_list
+        self.show_server_tree = show_server_tree
+        self.discord.add_event_handler('on_message', self._on_message)
+        self.discord.add_event_handler('on_message_edit',
+                                       self._on_message_edit)
+        self.discord.add_event_handler('on_message_delete',
+                                       self._on_message_delete)
+        self.discord.add_event_handler('on_resumed', self._on_resumed)
+
+    @classmethod
+    def from_window(cls, window):
+        """Hibernate `window`, which must not be used afterwards"""
+        window.close()
+        logger.info("Hibernating tab %s", window.name)
+        return cls(window.discord, window.name, window.channels,
+                   window.send_channel,
+                   messages=window.w_message_list.messages(),
+                   cursor=window.w_message_list.focused_message_id(),
+                   show_member_list=window.show_member_list,
+                   show_server_tree=window.show_server_tree)
+
+    def wake(self):
+        """Rebuild the ChatWindow of this tab"""
+        self.close()
+        logger.info("Waking tab %s", self.name)
+        window = ChatWindow(self.discord, self.channels, self.send_channel,
+                            self.name, messages=list(self.messages),
+                            cursor=self.cursor)
+        if not self.show_member_list:
+            window.toggle_member_list(False)
+        if not self.show_server_tree:
+            window.toggle_server_list(False)
+        return window
+
+    def snapshot(self):
+        return {
+            'name': self.name,
+            'channels': [ch.id for ch in self.channels],
+            'send_channel': self.send_channel and self.send_channel.id,
+            'cursor': self.cursor,
+            'show_member_list': self.show_member_list,
+            'show_server_tree': self.show_server_tree,
+        }
+
+    def reconcile(self):
+        self.channels[:] = [ch for ch in map(
+            lambda ch: self.discord.get_channel(ch.id), self.channels)
+            if ch is not None]
+        if self.send_channel is not None:
+            self.send_channel = self.discord.get_channel(self.send_channel.id)
+        if self.send_channel is None and len(self.channels) > 0:
+            self.send_channel = self.channels[0]
+
+    def close(self):
+        self.discord.remove_event_handlers(self)
+
+    def _on_resumed(self, client):
+        # Messages may have been missed, load them afresh when woken
+        if any(client.dispatches(ch) for ch in self.channels):
+            self.messages.clear()
+
+    def _record(self, message):
+        return self.discord.message_store.record(message)
+
+    def _on_message(self, message):
+        if message.channel not in self.channels:
+            return
+        self.messages.append(self._record(message))
+
+    def _on_message_edit(self, before, after):
+        if before.channel not in self.channels:
+            return
+        for index, m in enumerate(self.messages):
+            if m.id == int(before.id):
+                self.messages[index] = self._record(after)
+                break
+
+    def _on_message_delete(self, message):
+        if message.channel not in self.channels:
+            return
+        for m in self.messages:
+            if m.id == int(message.id):
+                self.messages.remove(m)
+                break
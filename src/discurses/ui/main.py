@@ -1,11 +1,14 @@
 import re
+import time
 import logging
 
 import urwid
 
 from discurses.ui import HasModal
-from discurses.ui import ChatWindow
-from discurses import keymaps
+from discurses.ui import ChatWindow, HibernatedTab
+from discurses.ui.authors import AuthorCache
+from discurses.ui.bandwidth import DrawThrottle, OutputMeter
+from discurses import config, keymaps, processing, snapshot
 from discurses.__about__ import __version__
 
 logger = logging.getLogger(__name__)
@@ -29,6 +32,7 @@ class MainUI(HasModal):
         ("message_channel_cur", "dark green", "default"),
         ("message_mention", "white", "dark gray"),
         ("message_mention_self", "light green", "dark gray"),
+        ("message_collapsed", "dark gray", "default"),
         ("send_channel_selector", "light red", "default"),
         ("send_channel_selector_sel", "default", "dark red"),
         ("servtree_channel", "default", "default"),
@@ -63,7 +67,21 @@ class MainUI(HasModal):
     def __init__(self, discord_client):
         self.discord = discord_client
         self.tabs = {}
+        self.current_tab = None
+        self.tab_left_at = {}
+        self.snapshot = None
         self.w_tabs = TabSelector(self)
+        self.authors = AuthorCache(self)
+        # Cut down terminal output for slow links
+        self.low_bandwidth = config.table.get('low_bandwidth', False)
+        if self.low_bandwidth:
+            # Only the timestamp of the focused message stands out
+            self.message_focus_attr = {
+                "message_timestamp": "message_timestamp_f"}
+        else:
+            self.message_focus_attr = MainUI.focus_attr
+        self.output = OutputMeter()
+        self.throttle = None
         self.frame = urwid.Frame(
             urwid.Filler(
                 urwid.Text(
@@ -87,19 +105,33 @@ class MainUI(HasModal):
             header=self.w_tabs)
 
         HasModal.__init__(self, self.frame)
+        self.discord.add_event_handler('on_unread_update',
+                                       self._on_unread_update)
 
         self.urwid_loop = urwid.MainLoop(
             self._w_placeholder,
             palette=MainUI.palette,
             unhandled_input=lambda key: self._keypress(None, key),
             event_loop=urwid.AsyncioEventLoop(loop=self.discord.loop),
+            screen=self.discord.screen,
             pop_ups=True)
 
-        def refresh(_loop, _data):
-            _loop.draw_screen()
-            _loop.set_alarm_in(2, refresh)
+        self.output.attach(self.urwid_loop.screen)
+        if self.low_bandwidth:
+            self.throttle = DrawThrottle(
+                self.urwid_loop, self.output,
+                config.table.get('low_bandwidth_rate', 2048))
+        else:
+            def refresh(_loop, _data):
+                _loop.draw_screen()
+                _loop.set_alarm_in(2, refresh)
 
-        self.urwid_loop.set_alarm_in(0.2, refresh)
+            self.urwid_loop.set_alarm_in(0.2, refresh)
+
+        self.hibernate_after = config.table.get('hibernate_after', 300)
+        if self.hibernate_after:
+            self.urwid_loop.set_alarm_in(
+                min(30, self.hibernate_after), self._hibernate_idle_tabs)
 
         self.urwid_loop.start()
 
@@ -116,27 +148,80 @@ class MainUI(HasModal):
                 index = 10
             self.set_tab(index - 1)
 
+    def save_snapshot(self):
+        """Save the tabs for the warm start of the next session"""
+        try:
+            snapshot.save(self)
+        except OSError:
+            logger.exception("Could not save the snapshot")
+
     @keymaps.GLOBAL.command
-    def quit(widget, size, key):
+    def quit(self):
         logger.info('User quit')
-        widget.urwid_loop.stop()
-        widget.discord_loop.stop()
+        self.urwid_loop.stop()
+        self.discord.loop.stop()
         raise urwid.ExitMainLoop()
 
     @keymaps.GLOBAL.command
-    def focus_tab_selector(widget, size, key):
-        widget.frame.set_focus('header')
+    def focus_tab_selector(self):
+        self.frame.set_focus('header')
+
+    @keymaps.GLOBAL.command
+    def redraw(self):
+        self.draw_screen()
 
     @keymaps.GLOBAL.command
-    def redraw(widget, size, key):
-        widget.draw_screen()
+    def show_output_stats(self):
+        tab = self.tabs.get(self.current_tab)
+        if isinstance(tab, ChatWindow):
+            tab.w_statusbar.echo(
+                "Terminal output: {0}, {1}/s, {2} draws",
+                processing.format_bytes(self.output.bytes),
+                processing.format_bytes(int(self.output.rate())),
+                self.output.draws)
 
     def set_tab(self, tab):
         if tab not in self.tabs.keys():
             self.tabs[tab] = (ChatWindow(
                 self.discord, [], None, name=str(tab + 1)))
+        elif isinstance(self.tabs[tab], HibernatedTab):
+            self.tabs[tab] = self.tabs[tab].wake()
+        if self.current_tab is not None and self.current_tab != tab:
+            self.tab_left_at[self.current_tab] = time.monotonic()
+        self.current_tab = tab
         self.w_tabs.update_columns(tab)
         self.set_body(self.tabs[tab])
+        self.tabs[tab].mark_read()
+
+    def delete_tab(self, tab):
+        self.tabs.pop(tab).close()
+        self.tab_left_at.pop(tab, None)
+        if tab == self.current_tab:
+            self.current_tab = None
+
+    def update_tabs(self):
+        self.w_tabs.update_columns(self.current_tab)
+
+    def visible_channels(self):
+        tab = self.tabs.get(self.current_tab)
+        if tab is None:
+            return []
+        return tab.channels
+
+    def _on_unread_update(self, channel_id):
+        self.update_tabs()
+
+    def _hibernate_idle_tabs(self, loop, _data):
+        """Hibernate background tabs that have been idle for too long"""
+        now = time.monotonic()
+        for index, tab in self.tabs.items():
+            if index == self.current_tab or not isinstance(tab, ChatWindow):
+                continue
+            if now - self.tab_left_at.get(index, now) > self.hibernate_after:
+                self.tabs[index] = HibernatedTab.from_window(tab)
+        self.update_tabs()
+        loop.set_alarm_in(min(30, self.hibernate_after),
+                          self._hibernate_idle_tabs)
 
     def set_body(self, w):
         self.frame.set_body(w)
@@ -146,10 +231,51 @@ class MainUI(HasModal):
         pass
 
     def draw_screen(self):
-        self.urwid_loop.draw_screen()
-
-    def on_ready(self):
-        self.set_tab(0)
+        if self.throttle is not None:
+            self.throttle.request()
+        else:
+            self.urwid_loop.draw_screen()
+
+    def get_servers(self):
+        """The servers, from the snapshot until READY"""
+        if self.snapshot is not None:
+            return self.snapshot.servers
+        return self.discord.servers
+
+    def get_private_channels(self):
+        if self.snapshot is not None:
+            return self.snapshot.private_channels
+        return self.discord.private_channels
+
+    def warm_start(self):
+        """Rebuild the tabs of the last session from the snapshot"""
+        start = time.perf_counter()
+        self.snapshot = snapshot.load()
+        if self.snapshot is None or not self.snapshot.tabs:
+            self.snapshot = None
+            return
+        current = self.snapshot.current_tab
+        if current not in self.snapshot.tabs:
+            current = min(self.snapshot.tabs)
+        # Every tab starts out hibernated, focusing one wakes it
+        for index, td in self.snapshot.tabs.items():
+            self.tabs[index] = HibernatedTab(
+                self.discord, td['name'], td['channels'],
+                td['send_channel'], cursor=td['cursor'],
+                show_member_list=td['show_member_list'],
+                show_server_tree=td['show_server_tree'])
+        self.set_tab(current)
+        logger.info("Warm start took %.0f ms",
+                    (time.perf_counter() - start) * 1000)
+
+    def on_ready(self, reconnected=False):
+        if self.snapshot is None and not reconnected:
+            self.set_tab(0)
+            return
+        self.snapshot = None
+        for tab in self.tabs.values():
+            tab.reconcile()
+        self.update_tabs()
 
 
 class TabSelector(urwid.WidgetWrap):
@@ -168,28 +294,28 @@ class TabSelector(urwid.WidgetWrap):
         return key
 
     @keymaps.TAB_SELECTOR.command
-    def go_left(self, size, key):
+    def go_left(self):
         self.w_cols.focus_position = (
             self.w_cols.focus_position - 1) % len(self.w_cols.widget_list)
         self.ui.set_tab(self.w_cols.focus.index)
 
     @keymaps.TAB_SELECTOR.command
-    def go_right(self, size, key):
+    def go_right(self):
         self.w_cols.focus_position = (
             self.w_cols.focus_position + 1) % len(self.w_cols.widget_list)
         self.ui.set_tab(self.w_cols.focus.index)
 
     @keymaps.TAB_SELECTOR.command
-    def unfocus(self, size, key):
+    def unfocus(self):
         self.ui.frame.set_focus("body")
 
     @keymaps.TAB_SELECTOR.command
-    def delete_tab(self, size, key):
-        del self.ui.tabs[self.w_cols.focus.index]
+    def delete_tab(self):
+        self.ui.delete_tab(self.w_cols.focus.index)
         self.update_columns()
 
     @keymaps.TAB_SELECTOR.command
-    def new_tab(self, size, key):
+    def new_tab(self):
         self.ui.set_tab(len(self.ui.tabs))
 
     def _set_indicator(self, position):
@@ -201,7 +327,7 @@ class TabSelector(urwid.WidgetWrap):
     def update_columns(self, focus=None):
         cols = []
         for index, tab in self.ui.tabs.items():
-            cols.append((self.TabWidget(index, tab),
+            cols.append((self.TabWidget(index, tab, self.ui.discord.unread),
                          self.w_cols.options('weight', 1)))
         self.w_cols.contents = cols
         for t, options in self.w_cols.contents:
@@ -214,11 +340,13 @@ class TabSelector(urwid.WidgetWrap):
 
     class TabWidget(urwid.WidgetWrap):
 
-        def __init__(self, index, widget):
+        def __init__(self, index, widget, unread_index):
             self.index = index
             self.tab_widget = widget
+            label = widget.name + processing.unread_badge(
+                *unread_index.counts(widget.channels))
             self.attr = urwid.AttrMap(
                 urwid.Text(
-                    widget.name, align="center"),
+                    label, align="center"),
                 "tab_selector_tab")
             self.__super.__init__(self.attr)
@@ -4,22 +4,39 @@ import urwid
 import discord
 
 import discurses.keymaps as keymaps
+from discurses.width import truncate
 
 
 class MemberList(urwid.WidgetWrap):
     def __init__(self, chat_widget):
         self.chat_widget = chat_widget
         self.list_walker = urwid.SimpleListWalker([])
+        # Columns of the names, as of the last render
+        self.width = 20
+        # (member, Text) of every name
+        self.names = []
         self.w_listbox = urwid.ListBox(self.list_walker)
         self.update_list()
         self.__super.__init__(urwid.Padding(self.w_listbox, left=2))
-        keymaps.GLOBAL.add_command("redraw", self.update_list)
+        keymaps.CHAT.bind(chat_widget, "refetch_messages", self.update_list)
+        for event in ("on_member_join", "on_member_remove",
+                      "on_member_update"):
+            self.chat_widget.discord.add_event_handler(
+                event, self._on_member_event)
 
-        def updlst(*args, **kwargs):
-            self.update_list()
-        self.chat_widget.discord.add_event_handler("on_member_join", updlst)
-        self.chat_widget.discord.add_event_handler("on_member_remove", updlst)
-        self.chat_widget.discord.add_event_handler("on_member_update", updlst)
+    def _on_member_event(self, *args, **kwargs):
+        self.update_list()
+
+    def render(self, size, focus=False):
+        if size[0] != self.width:
+            self.width = size[0]
+            for member, w_name in self.names:
+                w_name.set_text(self._label(member))
+        return self._w.render(size, focus)
+
+    def _label(self, member):
+        # Left of the list, and either side of the name
+        return truncate(member.display_name, max(1, self.width - 4))
 
     def _get_user_attr(self, member):
         if member.status == discord.Status.online:
@@ -59,13 +76,17 @@ class MemberList(urwid.WidgetWrap):
                 if member.status == discord.Status.idle:
                     idle.append(member)
             members = on + idle + off
+            names = []
             for member in members:
+                w_name = urwid.Text(self._label(member), wrap='clip')
+                names.append((member, w_name))
                 items.append(
                     urwid.AttrMap(
-                        urwid.Padding(
-                            urwid.Text(member.display_name), left=1, right=1),
+                        urwid.Padding(w_name, left=1, right=1),
                         self._get_user_attr(member),
                         self._get_user_attr(member)))
+            self.names = names
             self.list_walker[:] = items
 
-        self.chat_widget.discord.async_do(callback())
+        self.chat_widget.discord.async_do(callback(), name="members",
+                                          scope=self.chat_widget)
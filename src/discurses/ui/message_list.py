@@ -1,71 +1,176 @@
+import asyncio
+import collections
 import datetime
+import os
+import shutil
+import time
 
+import aiohttp
 import discord
 import urwid
 
+import discurses.config
+import discurses.media
 import discurses.processing
 import discurses.keymaps as keymaps
+from discurses.records import MessageRecord
+from discurses.tasks import Priority
+from discurses.width import cell_width, truncate
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def _sort_key(row):
+    """Rows of the list sort by snowflake id"""
+    if isinstance(row, MessageRecord):
+        return row.id
+    return row.message.key
+
+
+class _Fetch:
+    """A page of history being fetched, at `priority`"""
+    __slots__ = ('priority',)
+
+    def __init__(self, priority):
+        self.priority = priority
+
+
 class MessageListWidget(urwid.WidgetWrap):
     """The Listbox of MessageWidgets"""
 
-    def __init__(self, discord_client, chat_widget):
+    def __init__(self, discord_client, chat_widget, messages=None,
+                 cursor=None):
         self.discord = discord_client
         self.ui = self.discord.ui
         self.chat_widget = chat_widget
-        self.list_walker = MessageListWalker(self)
+        # Rows on screen, as of the last render
+        self.screen_rows = 50
+        self.list_walker = MessageListWalker(self, messages)
         self.listbox = urwid.ListBox(self.list_walker)
-        self.discord.add_event_handler('on_message', self._on_message)
-        self.discord.add_event_handler('on_message_edit',
-                                       self._on_message_edit)
-        self.discord.add_event_handler('on_message_delete',
-                                       self._on_message_delete)
-        self.scroll_to_bottom()
+        self.discord.add_event_handler('on_resumed', self._on_resumed)
+        self.discord.add_event_handler('on_author_update',
+                                       self._on_author_update)
+        self.cursor = cursor
+        if not messages:
+            # After the cursor and list box, as a prefetched page is added
+            # right away
+            self.list_walker.get_logs(callback=self.scroll_to_cursor)
+        self.scroll_to_cursor()
         self.__super.__init__(self.listbox)
 
-    def add_message(self, message):
-        self.list_walker.append(
-            MessageWidget(self.discord, self.chat_widget, message))
-        focus_status, focus = self.list_walker.get_focus()
-        if not focus > len(self.list_walker) - 2:
+    def render(self, size, focus=False):
+        if len(size) > 1:
+            self.screen_rows = size[1]
+        return self._w.render(size, focus)
+
+    def add_message(self, record):
+        self.list_walker.seen(record)
+        self.list_walker.append(record)
+        self.list_walker.regroup(len(self.list_walker) - 1,
+                                 len(self.list_walker))
+        focus = self.list_walker.focus
+        if focus is None or not focus > len(self.list_walker) - 2:
             self.scroll_to_bottom()
         self.discord.ui.draw_screen()
 
-    def _on_message(self, message):
+    def message_added(self, record):
+        """Called by the MessageStore for new messages in the channels"""
         if len(self.list_walker) == 0:
             return  # No message to handle
-        if message.timestamp.date() != \
-                self.list_walker[-1].message.timestamp.date():
+        last = self.list_walker[-1]
+        if isinstance(last, MessageRecord) and \
+                record.timestamp.date() != last.timestamp.date():
             self.list_walker.append(
-                DatelineWidget(self.chat_widget, message.timestamp.date()))
-        if message.channel in self.chat_widget.channels:
-            self.add_message(message)
-
-    def _on_message_edit(self, before, after):
-        if before.channel in self.chat_widget.channels:
-            for mw in self.list_walker:
-                if before.id == mw.message.id:
-                    index = self.list_walker.index(mw)
-                    self.list_walker[index] = MessageWidget(
-                        self.discord, self.chat_widget, after)
-                    break
-
-    def _on_message_delete(self, m):
-        if m.channel in self.chat_widget.channels:
-            for mw in self.list_walker:
-                if m.id == mw.message.id:
-                    self.list_walker.remove(mw)
-                    logger.info("Removed message from listview")
-                    break
+                DatelineWidget(self.chat_widget, record.timestamp.date()))
+        self.add_message(record)
+
+    def message_edited(self, record):
+        self.list_walker.replace_message(record)
+
+    def message_deleted(self, record):
+        if self.list_walker.remove_message(record.id):
+            logger.info("Removed message from listview")
+
+    def _on_resumed(self, client):
+        self.list_walker.backfill(client)
+
+    def _on_author_update(self, server_id, author_ids):
+        updated = False
+        for mw in self.list_walker.widgets.values():
+            channel = mw.message.channel
+            if mw.message.author_id in author_ids and \
+                    not channel.is_private and channel.server.id == server_id:
+                mw.update_columns()
+                updated = True
+        if updated:
+            self.discord.ui.draw_screen()
+
+    def close(self):
+        """Release the channels in the MessageStore"""
+        self.list_walker.release_channels()
+
+    def focus_message(self, message_id):
+        """Focus the message with id `message_id`, if it is in the list"""
+        message_id = int(message_id)
+        for index, row in enumerate(self.list_walker):
+            if isinstance(row, MessageRecord) and row.id == message_id:
+                self.listbox.set_focus(index)
+                return True
+        return False
+
+    def jump_to(self, snowflake):
+        """
+        Focus the first message at or after the snowflake id `snowflake`,
+        loading the messages around it if needed.
+        """
+        snowflake = int(snowflake)
+        if self.focus_message(str(snowflake)):
+            return
+        self.list_walker.jump_to(
+            snowflake, callback=lambda: self._focus_snowflake(snowflake))
+
+    def _focus_snowflake(self, snowflake):
+        for index, row in enumerate(self.list_walker):
+            if isinstance(row, MessageRecord) and row.id >= snowflake:
+                self.listbox.set_focus(index)
+                self.discord.ui.draw_screen()
+                return
 
+    def focused_message_id(self):
+        row = self.list_walker.focused_row()
+        if isinstance(row, MessageRecord):
+            return str(row.id)
+        return None
+
+    def set_new_messages_marker(self, message_id):
+        """Mark the messages after `message_id` as new"""
+        self.list_walker.new_messages_after = message_id
+        if len(self.list_walker) > 0:
+            self.list_walker.sort_messages()
+
+    def messages(self):
+        """The records of the messages in the list, oldest first"""
+        return [row for row in self.list_walker
+                if isinstance(row, MessageRecord)]
+
+    def scroll_to_cursor(self):
+        """Focus the message to restore focus to, or the newest one"""
+        if self.cursor is not None and self.focus_message(self.cursor):
+            self.cursor = None
+            return
+        self.scroll_to_bottom()
+
+    @keymaps.MESSAGE_LIST.command
     def scroll_to_bottom(self):
         if len(self.list_walker) > 0:
             self.listbox.set_focus(len(self.list_walker) - 1)
 
+    @keymaps.MESSAGE_LIST.command
+    def scroll_to_top(self):
+        if len(self.list_walker) > 0:
+            self.listbox.set_focus(0)
+
     @keymaps.MESSAGE_LIST.keypress
     def keypress(self, size, key):
         return self._w.keypress(size, key)
@@ -80,7 +185,7 @@ class MessageListWidget(urwid.WidgetWrap):
 
     @keymaps.MESSAGE_LIST.command
     def update_all_columns(self):
-        for mw in self.list_walker:
+        for mw in self.list_walker.widgets.values():
             mw.update_columns()
 
     @keymaps.MESSAGE_LIST.command
@@ -89,65 +194,518 @@ class MessageListWidget(urwid.WidgetWrap):
 
 
 class MessageListWalker(urwid.MonitoredFocusList, urwid.ListWalker):
-    def __init__(self, list_widget):
+    """
+    The history of the channels of a tab, loaded per channel.
+
+    The list holds the MessageRecords of the messages, shared with other
+    tabs through the MessageStore, and the widgets of markers such as
+    dates. The widgets of messages are only made when displayed,
+    and the latest `WIDGET_CACHE` of them are kept.
+
+    For every channel it is known how far back its history has been loaded,
+    so that channels can be added and removed without reloading the others,
+    and the newest message seen, to backfill from after a reconnect.
+
+    The history of a channel does not have to be contiguous: jumping to a
+    message loads the messages around it, and a GapWidget marks where
+    messages between two loaded runs are missing. A gap is filled in when
+    it is scrolled to.
+    """
+
+    # Messages per request when backfilling or filling in a gap
+    BACKFILL_LIMIT = 100
+    # Messages per channel around a message jumped to
+    JUMP_LIMIT = 50
+
+    # Prefixes of the names of the tasks loading history for a channel
+    TASKS = ("history ", "backfill ", "gap ", "jump ")
+    # Bounds of the number of messages per history page of a channel
+    MIN_PAGE = 10
+    MAX_PAGE = 100
+    # Seconds of scrolling a history page should last at the current speed
+    PAGE_SECONDS = 2
+    # Widgets of messages kept around
+    WIDGET_CACHE = 256
+
+    def __init__(self, list_widget, messages=None):
         self.list_widget = list_widget
-        self.is_polling = False
-        self.top_reached = False
+        self.store = list_widget.discord.message_store
+        # Channel id -> id of the oldest message loaded
+        self.oldest = {}
+        # Channel id -> id of the newest message seen
+        self.newest = {}
+        # Ids of the channels whose history has been requested
+        self.loaded = set()
+        # Ids of the channels whose history is fully loaded
+        self.exhausted = set()
+        # Channel id -> _Fetch in progress
+        self.polling = {}
+        # Ids of the channels a gap is being filled in for
+        self.filling = set()
+        # (time, position) of the latest focus changes, to tell how fast
+        # the list is scrolled
+        self.moves = collections.deque(maxlen=16)
+        self.prefetch_distance = discurses.config.table.get(
+            'history_prefetch_distance', 30)
+        self.new_messages_after = None
+        # Record id -> MessageWidget, least recently displayed first
+        self.widgets = collections.OrderedDict()
+        # Ids of the long messages expanded
+        self.expanded = set()
+        # Ids of the messages continuing a group, and the longest time
+        # between two messages of a group, in milliseconds
+        self.continued = set()
+        self.group_ms = discurses.config.table.get(
+            'group_minutes', 5) * 60 * 1000
         urwid.MonitoredFocusList.__init__(self, [])
-        self.get_logs(callback=list_widget.scroll_to_bottom)
+        if messages:
+            for channel in list_widget.chat_widget.channels:
+                self.loaded.add(channel.id)
+                self.store.acquire(channel.id, list_widget)
+            self._merge(messages)
+            for m in messages:
+                if m.channel.id not in self.oldest or \
+                        int(m.id) < self.oldest[m.channel.id]:
+                    self.oldest[m.channel.id] = int(m.id)
+            self.sort_messages()
+
+    def widget(self, row):
+        """The widget to display `row` with"""
+        if not isinstance(row, MessageRecord):
+            return row
+        widget = self.widgets.get(row.id)
+        if widget is None:
+            widget = self.widgets[row.id] = MessageWidget(
+                self.list_widget.discord, self.list_widget.chat_widget, row,
+                expanded=row.id in self.expanded,
+                continued=row.id in self.continued)
+            if len(self.widgets) > self.WIDGET_CACHE:
+                self.widgets.popitem(last=False)
+        else:
+            self.widgets.move_to_end(row.id)
+        return widget
 
-    def get_logs(self, before=None, callback=lambda: None):
-        if before is None and len(self) > 0:
-            before = self[0].message.timestamp
-        if self.is_polling or self.top_reached:
+    def focused_row(self):
+        if self.focus is None or self.focus >= len(self):
+            return None
+        return self[self.focus]
+
+    def get_focus(self):
+        row = self.focused_row()
+        if row is None:
+            return None, None
+        return self.widget(row), self.focus
+
+    def get_next(self, position):
+        try:
+            position = self.next_position(position)
+        except IndexError:
+            return None, None
+        return self.widget(self[position]), position
+
+    def get_prev(self, position):
+        try:
+            position = self.prev_position(position)
+        except IndexError:
+            return None, None
+        return self.widget(self[position]), position
+
+    def replace_message(self, record):
+        """Replace the message with the id of `record`, if it is listed"""
+        for index, row in enumerate(self):
+            if isinstance(row, MessageRecord) and row.id == record.id:
+                self.widgets.pop(record.id, None)
+                self[index] = record
+                return True
+        return False
+
+    def remove_message(self, message_id):
+        message_id = int(message_id)
+        for index, row in enumerate(self):
+            if isinstance(row, MessageRecord) and row.id == message_id:
+                self.widgets.pop(message_id, None)
+                self.continued.discard(message_id)
+                del self[index]
+                # The next message may now start a group
+                self.regroup(index, index + 1)
+                return True
+        return False
+
+    def _continues(self, index):
+        """Whether the row at `index` continues the group before it"""
+        row = self[index]
+        if index == 0 or not self.group_ms or \
+                not isinstance(row, MessageRecord):
+            return False
+        previous = self[index - 1]
+        return isinstance(previous, MessageRecord) and \
+            previous.author_id == row.author_id and \
+            previous.channel.id == row.channel.id and \
+            (row.id >> 22) - (previous.id >> 22) <= self.group_ms
+
+    def regroup(self, start, end):
+        """Update the grouping of the rows from `start` to `end`"""
+        for index in range(max(0, start), min(end, len(self))):
+            row = self[index]
+            if not isinstance(row, MessageRecord):
+                continue
+            continued = self._continues(index)
+            if continued != (row.id in self.continued):
+                if continued:
+                    self.continued.add(row.id)
+                else:
+                    self.continued.discard(row.id)
+                # Made again when next displayed
+                self.widgets.pop(row.id, None)
+
+    @property
+    def is_polling(self):
+        return len(self.polling) > 0
+
+    @property
+    def top_reached(self):
+        channels = self.list_widget.chat_widget.channels
+        return len(channels) > 0 and \
+            all(ch.id in self.exhausted for ch in channels)
+
+    def scroll_speed(self):
+        """Positions per second the list is scrolled up at, lately"""
+        now = time.monotonic()
+        moves = [(t, p) for t, p in self.moves if now - t < 1]
+        if len(moves) < 2:
+            return 0
+        (t0, p0), (t1, p1) = moves[0], moves[-1]
+        return max(0, p0 - p1) / max(t1 - t0, 0.1)
+
+    def page_size(self):
+        """
+        Messages per channel to load in a page of history: enough to fill
+        the screen twice, and more when scrolling fast, shared among the
+        channels of the tab.
+        """
+        wanted = 2 * self.list_widget.screen_rows + \
+            self.scroll_speed() * self.PAGE_SECONDS
+        channels = max(1, len(self.list_widget.chat_widget.channels))
+        return int(min(self.MAX_PAGE,
+                       max(self.MIN_PAGE, wanted / channels)))
+
+    def get_logs(self, channels=None, callback=lambda: None,
+                 priority=Priority.INTERACTIVE):
+        """
+        Load the next page of history of `channels`, by default of every
+        channel of the tab whose history is not fully loaded yet.
+
+        An interactive fetch takes over from a background one of the same
+        channel, which may be waiting for other background tasks.
+        """
+        if not self.list_widget.discord.received_ready:
             return
-        self.is_polling = True
+        if channels is None:
+            channels = self.list_widget.chat_widget.channels
+        for channel in channels:
+            if channel.id in self.exhausted:
+                continue
+            fetch = self.polling.get(channel.id)
+            if fetch is not None and (
+                    fetch.priority is Priority.INTERACTIVE or
+                    priority is Priority.BACKGROUND):
+                continue
+            if channel.id not in self.loaded:
+                self.loaded.add(channel.id)
+                self.store.acquire(channel.id, self.list_widget)
+            page = self.store.page(channel.id, self.oldest.get(channel.id),
+                                   self.page_size())
+            if page is not None:
+                # Prefetched or loaded by another tab, no need to wait
+                self._add_page(channel, *page)
+                callback()
+                continue
+            # Supersedes the fetch in progress, if any
+            token = self.polling[channel.id] = _Fetch(priority)
+            self.list_widget.discord.async_do(
+                self._fetch(channel, token, self.page_size(), callback),
+                name="history " + channel.id,
+                scope=self.list_widget.chat_widget, priority=priority)
 
-        async def _callback():
+    async def _fetch(self, channel, token, limit, callback):
+        before = self.oldest.get(channel.id)
+        try:
+            try:
+                messages = await self.list_widget.discord.get_logs_from(
+                    channel, limit,
+                    before=before and discord.Object(id=str(before)))
+                records = self.store.add_page(channel.id, before, messages,
+                                              len(messages) < limit)
+            except discord.errors.Forbidden:
+                self.exhausted.add(channel.id)
+                self.append(ForbiddenWidget(self.list_widget.chat_widget,
+                                            channel))
+                messages = records = []
+        finally:
+            # Unless the fetch has been superseded since
+            if self.polling.get(channel.id) is token:
+                del self.polling[channel.id]
+        self._add_page(channel, records, len(messages) < limit)
+        callback()
+
+    def _add_page(self, channel, records, exhausted):
+        """Add a page of history older than what is loaded of `channel`"""
+        if exhausted:
+            self.exhausted.add(channel.id)
+        if len(records) > 0:
+            oldest = min(r.id for r in records)
+            if channel.id in self.oldest:
+                oldest = min(oldest, self.oldest[channel.id])
+            self.oldest[channel.id] = oldest
+        self._merge(records)
+        self.sort_messages()
+        self._modified()
+
+    def seen(self, message):
+        """Note that `message` is in the list"""
+        newest = self.newest.get(message.channel.id)
+        if newest is None or int(message.id) > newest:
+            self.newest[message.channel.id] = int(message.id)
+
+    def backfill(self, client):
+        """
+        Load the messages sent since the newest message seen in every
+        channel `client` dispatches, after its connection was lost.
+        """
+        for channel in self.list_widget.chat_widget.channels:
+            if not client.dispatches(channel):
+                continue
+            after = self.newest.get(channel.id)
+            if after is not None:
+                self.list_widget.discord.async_do(
+                    self._backfill(channel, after),
+                    name="backfill " + channel.id,
+                    scope=self.list_widget.chat_widget)
+
+    async def _backfill(self, channel, after):
+        chat_widget = self.list_widget.chat_widget
+        known = set(self._channel_ids(channel.id))
+        max_pages = max(1, discurses.config.table.get('backfill_pages', 5))
+        for _page in range(max_pages):
             messages = []
-            for channel in self.list_widget.chat_widget.channels:
-                try:
-                    async for m in self.list_widget.discord.logs_from(
-                            channel, before=before):
-                        messages.append(
-                            MessageWidget(self.list_widget.discord,
-                                          self.list_widget.chat_widget, m))
-                except discord.errors.Forbidden:
-                    messages.append(
-                                ForbiddenWidget(self.list_widget.chat_widget))
-            if messages == [] and len(
-                    self.list_widget.chat_widget.channels) > 0:
-                self.top_reached = True
-                messages = [TopReachedWidget(self.list_widget.chat_widget)]
-
-            self[0:0] = messages
+            async for m in self.list_widget.discord.logs_from(
+                    channel, limit=self.BACKFILL_LIMIT,
+                    after=discord.Object(id=str(after))):
+                messages.append(m)
+            if len(messages) == 0:
+                break
+            self._merge(messages)
+            after = max(int(m.id) for m in messages)
+            self.sort_messages()
+            self._modified()
+            if len(messages) < self.BACKFILL_LIMIT or \
+                    any(int(m.id) in known for m in messages):
+                # Caught up with the messages received live
+                break
+        else:
+            logger.warning("Could not backfill %s past %s", channel.id, after)
+            newer = [i for i in self._channel_ids(channel.id) if i > after]
+            self.append(GapWidget(chat_widget, channel, after,
+                                  min(newer) if newer else None))
             self.sort_messages()
             self._modified()
-            self.is_polling = False
-            callback()
+        logger.info("Backfilled %s", channel.id)
 
-        self.list_widget.discord.async_do(_callback())
+    def _channel_ids(self, channel_id):
+        """The ids of the messages of a channel in the list, as ints"""
+        return [row.id for row in self
+                if isinstance(row, MessageRecord) and
+                row.channel.id == channel_id]
 
-    def sort_messages(self):
-        st = []
-        dates = []
-        for mw in self:
-            if mw.message.id in st or isinstance(mw, DatelineWidget):
-                self.remove(mw)
+    def _gaps(self, channel_id):
+        return [mw for mw in self if isinstance(mw, GapWidget) and
+                mw.channel.id == channel_id]
+
+    def _merge(self, messages):
+        self.extend(self.store.add(messages))
+        for m in messages:
+            self.seen(m)
+
+    def fill_gap(self, gap, upwards):
+        """
+        Load the next page of the messages missing at `gap`, from its newer
+        end if scrolling `upwards` and from its older end otherwise.
+        """
+        if gap.channel.id in self.filling:
+            return
+        self.filling.add(gap.channel.id)
+        self.list_widget.discord.async_do(
+            self._fill_gap(gap, upwards), name="gap " + gap.channel.id,
+            scope=self.list_widget.chat_widget)
+
+    async def _fill_gap(self, gap, upwards):
+        try:
+            if upwards and gap.before is not None:
+                query = {'before': discord.Object(id=str(gap.before))}
             else:
-                st.append(mw.message.id)
-            if isinstance(mw, MessageWidget):
-                if mw.message.timestamp.date() not in dates:
-                    dates.append(mw.message.timestamp.date())
+                query = {'after': discord.Object(id=str(gap.after))}
+            messages = []
+            async for m in self.list_widget.discord.logs_from(
+                    gap.channel, limit=self.BACKFILL_LIMIT, **query):
+                messages.append(m)
+        finally:
+            self.filling.discard(gap.channel.id)
+        known = set(self._channel_ids(gap.channel.id))
+        ids = [int(m.id) for m in messages]
+        self._merge(messages)
+        if len(messages) < self.BACKFILL_LIMIT or \
+                any(i in known for i in ids):
+            # The runs on both sides of the gap have met
+            if gap in self:
+                self.remove(gap)
+        elif 'before' in query:
+            gap.move(gap.after, min(ids))
+        else:
+            gap.move(max(ids), gap.before)
+        self.sort_messages()
+        self._modified()
+
+    def jump_to(self, snowflake, callback=lambda: None):
+        """Load the messages around the snowflake id `snowflake`"""
+        for channel in self.list_widget.chat_widget.channels:
+            if channel.id in self.exhausted and \
+                    channel.id not in self.oldest:
+                continue
+            self.list_widget.discord.async_do(
+                self._jump(channel, snowflake, callback),
+                name="jump " + channel.id,
+                scope=self.list_widget.chat_widget)
+
+    async def _jump(self, channel, snowflake, callback):
+        messages = []
+        async for m in self.list_widget.discord.logs_from(
+                channel, limit=self.JUMP_LIMIT,
+                around=discord.Object(id=str(snowflake))):
+            messages.append(m)
+        if len(messages) == 0:
+            return
+        ids = [int(m.id) for m in messages]
+        low, high = min(ids), max(ids)
+        known = self._channel_ids(channel.id)
+        if set(ids) & set(known):
+            # Joined to the history loaded
+            if channel.id in self.oldest:
+                self.oldest[channel.id] = min(self.oldest[channel.id], low)
+        else:
+            # A detached run. The history loaded keeps being extended
+            # from `oldest`, down to it.
+            self._mark_gaps(channel, known, low, high)
+        self._merge(messages)
+        self.sort_messages()
+        self._modified()
+        callback()
+
+    def _mark_gaps(self, channel, known, low, high):
+        """Mark the gaps around a run of messages from `low` to `high`"""
+        chat_widget = self.list_widget.chat_widget
+        for gap in self._gaps(channel.id):
+            if gap.after < low and (gap.before is None or gap.before > high):
+                # The run is in the middle of this gap, split it in two
+                before = gap.before
+                gap.move(gap.after, low)
+                self.append(GapWidget(chat_widget, channel, high, before))
+                return
+        older = [i for i in known if i < low]
+        newer = [i for i in known if i > high]
+        if older:
+            self.append(GapWidget(chat_widget, channel, max(older), low))
+        elif channel.id not in self.exhausted:
+            # Nothing older is loaded, possibly not even the latest
+            # messages yet, but there may be older messages
+            self.append(GapWidget(chat_widget, channel, 0, low))
+        if newer:
+            self.append(GapWidget(chat_widget, channel, high, min(newer)))
 
-        for d in dates:
-            self.append(DatelineWidget(self.list_widget.chat_widget, d))
-            logger.debug("Added dateline")
-        self.sort(key=lambda mw: mw.message.timestamp)
+    def update_channels(self):
+        """
+        Follow changes to the channels of the tab, loading the history of
+        the added channels and dropping that of the removed ones.
+        """
+        current = set(ch.id for ch in self.list_widget.chat_widget.channels)
+        removed = self.loaded - current
+        if removed:
+            self.remove_channels(removed)
+        self.get_logs(channels=[ch for ch in
+                                self.list_widget.chat_widget.channels
+                                if ch.id not in self.loaded],
+                      callback=self.list_widget.scroll_to_cursor)
+
+    def remove_channels(self, channel_ids):
+        tasks = self.list_widget.discord.tasks
+        for channel_id in channel_ids:
+            self.store.release(channel_id, self.list_widget)
+            for prefix in self.TASKS:
+                tasks.cancel(self.list_widget.chat_widget, prefix + channel_id)
+            self.filling.discard(channel_id)
+            self.polling.pop(channel_id, None)
+            self.oldest.pop(channel_id, None)
+            self.newest.pop(channel_id, None)
+            self.exhausted.discard(channel_id)
+            self.loaded.discard(channel_id)
+        self[:] = [row for row in self
+                   if not self._of_channels(row, channel_ids)]
+        for record_id in [i for i, mw in self.widgets.items()
+                          if mw.message.channel.id in channel_ids]:
+            del self.widgets[record_id]
+        self.sort_messages()
+
+    def release_channels(self):
+        for channel_id in self.loaded:
+            self.store.release(channel_id, self.list_widget)
+
+    @staticmethod
+    def _of_channels(row, channel_ids):
+        channel = row.channel if isinstance(row, MessageRecord) \
+            else row.message.channel
+        return channel is not None and channel.id in channel_ids
+
+    def sort_messages(self):
+        chat_widget = self.list_widget.chat_widget
+        focus = self.focused_row()
+        ids = set()
+        dates = set()
+        items = []
+        for row in self:
+            if isinstance(row, (DatelineWidget, NewMessagesWidget,
+                                TopReachedWidget)):
+                continue
+            if isinstance(row, MessageRecord):
+                if row.id in ids:
+                    continue
+                ids.add(row.id)
+                dates.add(row.timestamp.date())
+            items.append(row)
+
+        items += [DatelineWidget(chat_widget, d) for d in dates]
+        if self.new_messages_after is not None:
+            items.append(NewMessagesWidget(chat_widget,
+                                           self.new_messages_after))
+        if self.top_reached:
+            items.append(TopReachedWidget(chat_widget))
+        items.sort(key=_sort_key)
+        self[:] = items
+        self.continued &= ids
+        self.regroup(0, len(items))
+        # Keep the focus on the same message
+        for index, row in enumerate(items):
+            if row is focus:
+                self.focus = index
+                break
 
     def invalidate(self):
+        """Drop everything and load the history again"""
+        channel_ids = set(self.loaded)
+        self.remove_channels(channel_ids)
+        for channel_id in channel_ids:
+            self.store.discard(channel_id)
         self[:] = []
-        self.get_logs(callback=self.list_widget.scroll_to_bottom)
+        self.widgets.clear()
+        self.get_logs(callback=self.list_widget.scroll_to_cursor)
 
     def _modified(self):
         if self.focus is not None:
@@ -175,6 +733,17 @@ class MessageListWalker(urwid.MonitoredFocusList, urwid.ListWalker):
                 raise ValueError
         except (TypeError, ValueError):
             raise IndexError("No widget at position %s" % (position, ))
+        self.moves.append((time.monotonic(), position))
+        if position < self.prefetch_distance:
+            # Load the next page before the top is reached
+            self.get_logs(priority=Priority.BACKGROUND)
+        # Fill in the gaps the focus has come up to, rather than those
+        # merely on screen
+        if position > 0 and isinstance(self[position - 1], GapWidget):
+            self.fill_gap(self[position - 1], upwards=True)
+        if position < len(self) - 1 and \
+                isinstance(self[position + 1], GapWidget):
+            self.fill_gap(self[position + 1], upwards=False)
         self.focus = position
         self._modified()
 
@@ -205,19 +774,38 @@ class MessageListWalker(urwid.MonitoredFocusList, urwid.ListWalker):
 
 
 class MessageWidget(urwid.WidgetWrap):
-    """A view of a message in the MessageListWidget"""
+    """
+    A view of a MessageRecord in the MessageListWidget.
+
+    A message following one of the same author in the same channel within
+    `group_minutes` continues its group, and is shown without timestamp,
+    channel and author.
+
+    Messages longer than `collapse_lines` lines are collapsed to that many
+    until expanded. Their full text is only laid out once expanded.
+    """
+
+    # Characters per line a collapsed message may have on average
+    CHARS_PER_LINE = 200
 
-    def __init__(self, discord_client, chat_widget, m):
+    def __init__(self, discord_client, chat_widget, record, expanded=False,
+                 continued=False):
         self.discord = discord_client
         self.ui = self.discord.ui
         self.chat_widget = chat_widget
-        self.message = m
-        self.processed = discurses.processing.format_incomming(
-            m, self.chat_widget)
-        for at in m.attachments:
-            self.processed += "\n" + at.get('url')
+        self.message = record
+        self.expanded = expanded
+        # Whether the message continues a group of messages of its author
+        self.continued = continued
+        self.collapse_lines = discurses.config.table.get('collapse_lines', 10)
+        self.clipped = None
+        if self.collapse_lines:
+            self.clipped = discurses.processing.clip_markup(
+                record.markup, self.collapse_lines,
+                self.collapse_lines * self.CHARS_PER_LINE)
+        self.w_full = None
         self.columns_w = urwid.Columns([])
-        w = urwid.AttrMap(self.columns_w, None, discurses.ui.MainUI.focus_attr)
+        w = urwid.AttrMap(self.columns_w, None, self.ui.message_focus_attr)
         self.update_columns()
         self.__super.__init__(w)
 
@@ -229,62 +817,94 @@ class MessageWidget(urwid.WidgetWrap):
     def update_columns(self):
         channel_visible = len(self.chat_widget.channels) > 1
         channel_name = self.chat_widget.channel_names[self.message.channel]
-        channel_width = min(len(channel_name) + 1, 20)
-        author_nickname = self.message.author.display_name
-        author_width_extra = 1 if \
-            len(author_nickname.encode("utf-8")) > len(author_nickname) else 0
-        author_width = 30 - channel_width + author_width_extra
+        channel_width = min(cell_width(channel_name) + 1, 20)
+        author = self.ui.authors.get(self.message)
+        author_width = 30 - channel_width
         channel_attr_map = "message_channel" \
             if len(self.chat_widget.channels) > 1 and \
-            self.message.channel == self.chat_widget.send_channel \
+            self.message.channel == self.chat_widget.send_channel and \
+            not self.ui.low_bandwidth \
             else "message_channel_cur"
+        # Continuations of a group only show the content, lined up with
+        # that of the first message
+        indent = 0
+        if self.continued:
+            timestamp = ""
+            indent = author_width + (channel_width if channel_visible else 0)
+        else:
+            timestamp = self.message.timestamp.replace(
+                tzinfo=datetime.timezone.utc).astimezone(
+                    tz=None).strftime("%H:%M")
         self.columns = [
             self.Column(
                 'timestamp',
                 True, ('given', 7),
-                self.message.timestamp.replace(
-                    tzinfo=datetime.timezone.utc).astimezone(
-                        tz=None).strftime("%H:%M"),
+                timestamp,
                 attr_map="message_timestamp",
                 padding=(1, 1)
             ),
             self.Column(
                 'channel',
-                channel_visible, ('given', channel_width),
-                channel_name[:channel_width - 1],
+                channel_visible and not self.continued,
+                ('given', channel_width),
+                truncate(channel_name, channel_width - 1),
                 attr_map=channel_attr_map,
                 padding=(0, 1)
             ),
             self.Column(
                 'author',
-                True, ('given', author_width),
-                "{0}:".format(author_nickname.encode("utf-8")[:author_width - 2].
-                              decode("utf-8", "ignore")),
-                attr_map="message_author",
+                not self.continued, ('given', author_width),
+                author.label(author_width - 1),
+                attr_map=author.attr,
                 padding=(0, 1),
                 align="right"
             ),
             self.Column(
                 'content',
                 True, ('weight', 1),
-                self.processed,
+                self._content(),
                 attr_map="message_content",
-                padding=(0, 1)
+                padding=(indent, 1)
             )
         ]
-        visible_cols = []
-        for col in self.columns:
-            if col.visible:
-                visible_cols.append(col)
-                self.columns_w.contents = [(c.get_widget(),
-                                            self.columns_w.options(
-                                                width_type=c.width[0],
-                                                width_amount=c.width[1]))
-                                           for c in visible_cols]
+        self.columns_w.contents = [(c.get_widget(),
+                                    self.columns_w.options(
+                                        width_type=c.width[0],
+                                        width_amount=c.width[1]))
+                                   for c in self.columns if c.visible]
+
+    def _content(self):
+        """The content, or a widget of it if the message is long"""
+        if self.clipped is None:
+            return self.message.markup
+        if self.expanded:
+            if self.w_full is None:
+                self.w_full = LongText(self.message.markup)
+            return self.w_full
+        head, hidden = self.clipped
+        return urwid.Pile([
+            ClippedText(head, self.collapse_lines),
+            urwid.Text(("message_collapsed", "[{0} more lines, e to expand]"
+                        .format(hidden) if hidden else
+                        "[more, e to expand]"))])
 
     def selectable(self) -> bool:
         return True
 
+    @keymaps.MESSAGE_LIST_ITEM.command
+    def toggle_expanded(self):
+        if self.clipped is None:
+            return
+        self.expanded = not self.expanded
+        walker = self.chat_widget.w_message_list.list_walker
+        if self.expanded:
+            walker.expanded.add(self.message.id)
+        else:
+            walker.expanded.discard(self.message.id)
+            self.w_full = None
+        self.update_columns()
+        walker._modified()
+
     @keymaps.MESSAGE_LIST_ITEM.command
     def edit_message(self):
         self.chat_widget.w_message_edit.edit_message(self.message)
@@ -292,9 +912,9 @@ class MessageWidget(urwid.WidgetWrap):
 
     @keymaps.MESSAGE_LIST_ITEM.command
     def delete_message(self):
-        if self.message.author == self.discord.user or \
-                self.message.channel.permissions_for(self.discord.user).\
-                manage_messages:
+        user = self.discord.client_for(self.message.channel).user
+        if self.message.author_id == user.id or \
+                self.message.channel.permissions_for(user).manage_messages:
             self.discord.async_do(self.discord.delete_message(self.message))
 
     @keymaps.MESSAGE_LIST_ITEM.command
@@ -304,19 +924,17 @@ class MessageWidget(urwid.WidgetWrap):
                 self.delete_message()
         self.chat_widget.open_confirm_prompt(
             callback, "Delete message?",
-            [self.message.author.display_name + ":\n   ",
-             discurses.processing.format_incomming(self.message,
-                                                   self.chat_widget)])
+            [self.message.author_name + ":\n   ", self.message.markup])
 
     @keymaps.MESSAGE_LIST_ITEM.command
     def quote_message(self):
-        self.chat_widget.w_edit_message.reply_to(self.message)
+        self.chat_widget.w_message_edit.reply_to(self.message)
         self.chat_widget.set_focus('MESSAGE_EDIT')
 
     @keymaps.MESSAGE_LIST_ITEM.command
     def mention_author(self):
-        self.chat_widget.w_edit_message.edit.insert_text("<@!{0}>".format(
-            self.message.author.id))
+        self.chat_widget.w_message_edit.edit.insert_text("<@!{0}>".format(
+            self.message.author_id))
         self.chat_widget.set_focus('MESSAGE_EDIT')
 
     @keymaps.MESSAGE_LIST_ITEM.command
@@ -324,6 +942,64 @@ class MessageWidget(urwid.WidgetWrap):
         discurses.config.to_clipboard(self.message.clean_content)
         return
 
+    def _fetch_attachment(self, callback):
+        """
+        Download the first attachment and run the coroutine function
+        `callback` with its path
+        """
+        if len(self.message.attachments) == 0:
+            return
+        attachment = self.message.attachments[0]
+        statusbar = self.chat_widget.w_statusbar
+        filename = attachment.get('filename')
+
+        def progress(done, total):
+            statusbar.echo("{0}: {1} of {2}", filename,
+                           discurses.processing.format_bytes(done),
+                           discurses.processing.format_bytes(total or 0))
+
+        async def _fetch():
+            try:
+                path = await self.discord.media.fetch(attachment, progress)
+                statusbar.echo("")
+                await callback(path)
+            except (discurses.media.MediaError, OSError, aiohttp.ClientError,
+                    asyncio.TimeoutError) as e:
+                statusbar.echo("{0}: {1}", filename,
+                               str(e) or type(e).__name__)
+
+        self.discord.async_do(_fetch())
+
+    @keymaps.MESSAGE_LIST_ITEM.command
+    def open_attachment(self):
+        async def _open(path):
+            discurses.config.open_file(path)
+
+        self._fetch_attachment(_open)
+
+    @keymaps.MESSAGE_LIST_ITEM.command
+    def ask_save_attachment(self):
+        if len(self.message.attachments) == 0:
+            return
+        filename = self.message.attachments[0].get('filename')
+
+        def _callback(txt):
+            self.chat_widget.close_pop_up()
+            if txt is None:
+                return
+            destination = os.path.expanduser(txt)
+
+            async def _save(path):
+                await self.discord.loop.run_in_executor(
+                    None, shutil.copyfile, path, destination)
+                self.chat_widget.w_statusbar.echo("Saved {0}", destination)
+
+            self._fetch_attachment(_save)
+
+        self.chat_widget.open_text_prompt(
+            _callback, "Save attachment",
+            os.path.join("~", "Downloads", filename))
+
     @keymaps.MESSAGE_LIST_ITEM.command
     def select_channel(self):
         self.chat_widget.set_send_channel(self.message.channel)
@@ -347,13 +1023,55 @@ class MessageWidget(urwid.WidgetWrap):
             self.align = align
 
         def get_widget(self):
-            txt = urwid.Text(self.content, align=self.align)
+            if isinstance(self.content, urwid.Widget):
+                txt = self.content
+            else:
+                txt = urwid.Text(self.content, align=self.align)
             if self.padding[0] > 0 or self.padding[1] > 0:
                 txt = urwid.Padding(
                     txt, left=self.padding[0], right=self.padding[1])
             return urwid.AttrMap(txt, self.attr_map)
 
 
+class ClippedText(urwid.Text):
+    """Text showing at most `max_rows` rows"""
+
+    def __init__(self, markup, max_rows):
+        self.max_rows = max_rows
+        urwid.Text.__init__(self, markup)
+
+    def rows(self, size, focus=False):
+        return min(self.max_rows, urwid.Text.rows(self, size, focus))
+
+    def render(self, size, focus=False):
+        canvas = urwid.Text.render(self, size, focus)
+        if canvas.rows() > self.max_rows:
+            canvas = urwid.CompositeCanvas(canvas)
+            canvas.trim_end(canvas.rows() - self.max_rows)
+        return canvas
+
+
+class LongText(urwid.Text):
+    """Text of a long message, keeping its layout for the latest widths"""
+
+    LAYOUTS = 4
+
+    def __init__(self, markup):
+        # Columns -> layout
+        self.layouts = collections.OrderedDict()
+        urwid.Text.__init__(self, markup)
+
+    def _update_cache_translation(self, maxcol, ta):
+        layout = self.layouts.get(maxcol)
+        if layout is None:
+            urwid.Text._update_cache_translation(self, maxcol, ta)
+            layout = self.layouts[maxcol] = self._cache_translation
+            if len(self.layouts) > self.LAYOUTS:
+                self.layouts.popitem(last=False)
+        self._cache_maxcol = maxcol
+        self._cache_translation = layout
+
+
 class TopReachedWidget(urwid.WidgetWrap):
     """This widget will be displayed at the top of the channel history"""
 
@@ -388,9 +1106,9 @@ class TopReachedWidget(urwid.WidgetWrap):
 class ForbiddenWidget(urwid.WidgetWrap):
     """This widget will be displayed in channels you can't access"""
 
-    def __init__(self, chat_widget):
+    def __init__(self, chat_widget, channel=None):
         self.chat_widget = chat_widget
-        self.message = FakeMessage(datetime.datetime.min)
+        self.message = FakeMessage(datetime.datetime.min, channel)
         self._selectable = False
         txt = urwid.Text(
             "                                                               \n"
@@ -432,11 +1150,65 @@ class DatelineWidget(urwid.WidgetWrap):
         pass
 
 
+class NewMessagesWidget(urwid.WidgetWrap):
+    """Marks where the unread messages start in the listwidget"""
+
+    def __init__(self, chat_widget, after):
+        self.chat_widget = chat_widget
+        # Just after the last read message
+        self.message = FakeMessage(
+            discord.utils.snowflake_time(after) +
+            datetime.timedelta(milliseconds=1))
+        self._selectable = False
+        txt = urwid.Text(("dateline", "new messages"), align=urwid.RIGHT)
+        self.__super.__init__(urwid.Columns([
+            urwid.AttrMap(urwid.Divider("─"), "dateline"),
+            ('pack', txt)], dividechars=1))
+
+    def update_columns(*args, **kwargs):
+        pass
+
+
+class GapWidget(urwid.WidgetWrap):
+    """
+    Marks messages of a channel that are not loaded, between the message
+    ids `after` and `before`. `before` is None if it is not known where the
+    missing messages end.
+    """
+
+    def __init__(self, chat_widget, channel, after, before=None):
+        self.chat_widget = chat_widget
+        self.channel = channel
+        self._selectable = False
+        txt = urwid.Text(("dateline", "more messages in {0}".format(
+            discurses.processing.channel_name(channel))), align=urwid.CENTER)
+        self.__super.__init__(urwid.Columns([
+            urwid.AttrMap(urwid.Divider("╌"), "dateline"),
+            ('pack', txt),
+            urwid.AttrMap(urwid.Divider("╌"), "dateline")], dividechars=1))
+        self.move(after, before)
+
+    def move(self, after, before):
+        self.after = int(after)
+        self.before = None if before is None else int(before)
+        # Just after the last message before the gap
+        self.message = FakeMessage(
+            discord.utils.snowflake_time(self.after) +
+            datetime.timedelta(milliseconds=1), self.channel)
+
+    def update_columns(*args, **kwargs):
+        pass
+
+
 class FakeMessage:
-    """Very much a temporary thing"""
+    """Where a marker goes in the list"""
+    __slots__ = ('timestamp', 'channel', 'id', 'key')
 
-    def __init__(self, timestamp):
+    def __init__(self, timestamp, channel=None):
         self.timestamp = timestamp
+        self.channel = channel
         self.id = "0"
+        # Sorts with the ids of messages created at `timestamp`
+        self.key = discord.utils.time_snowflake(timestamp)
 
 
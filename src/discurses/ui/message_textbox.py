@@ -4,6 +4,7 @@ import urwid
 
 import discurses.processing as processing
 import discurses.keymaps as keymaps
+from discurses.tasks import Priority
 
 
 class MessageEditWidget(urwid.WidgetWrap):
@@ -68,7 +69,9 @@ class MessageEditWidget(urwid.WidgetWrap):
         if key is None:
             if self.editing is None:
                 self.discord.async_do(
-                    self.discord.send_typing(self.chat_widget.send_channel))
+                    self.discord.send_typing(self.chat_widget.send_channel),
+                    name="typing", scope=self.chat_widget,
+                    priority=Priority.BACKGROUND)
         return key
 
     def edit_message(self, message):
@@ -10,9 +10,11 @@ class ServerTree(urwid.WidgetWrap):
         self.chat_widget = chat_widget
         self.ui = chat_widget.ui
         self.close_callback = close_callback
+        self.unread = chat_widget.discord.unread
+        # channel id -> (server node, child key), to update badges
+        self.channel_nodes = {}
         items = []
-        for server in sorted(chat_widget.discord.servers,
-                             key=lambda s: s.name):
+        for server in sorted(self.ui.get_servers(), key=lambda s: s.name):
             node = {"name": server.name,
                     'server_tree': self,
                     'server': server,
@@ -27,13 +29,15 @@ class ServerTree(urwid.WidgetWrap):
             nodeobj = TreeNodeServer(node)
             nodeobj.expanded = False
             items.append(nodeobj)
+            self._index_channels(nodeobj)
 
-        if len(chat_widget.discord.private_channels) > 0:
+        private_channels = self.ui.get_private_channels()
+        if len(private_channels) > 0:
             node = {"name": "Private Chats",
                     'server_tree': self,
                     'server': None,
                     "children": []}
-            for ch in chat_widget.discord.private_channels:
+            for ch in private_channels:
                 name = ''
                 if ch.type == discord.ChannelType.private:
                     name = ch.user.display_name
@@ -49,16 +53,37 @@ class ServerTree(urwid.WidgetWrap):
             nodeobj = TreeNodeServer(node)
             nodeobj.expanded = False
             items.append(nodeobj)
+            self._index_channels(nodeobj)
 
         self.w_listbox = urwid.TreeListBox(TreeWalker(items))
         self.__super.__init__(self.w_listbox)
+        chat_widget.discord.add_event_handler('on_unread_update',
+                                              self._on_unread_update)
+
+    def _index_channels(self, server_node):
+        for key, child in enumerate(server_node.get_value()['children']):
+            self.channel_nodes[child['channel'].id] = (server_node, key)
+
+    def _on_unread_update(self, channel_id):
+        if channel_id not in self.channel_nodes:
+            return
+        server_node, key = self.channel_nodes[channel_id]
+        server_node.get_widget().update_badge()
+        server_node.get_child_node(key).get_widget().update_badge()
 
     def selectable(self):
         return True
 
     @keymaps.SERVER_TREE.keypress
     def keypress(self, size, key):
-        return self.w_listbox.keypress(size, key)
+        key = self.w_listbox.keypress(size, key)
+        self._prefetch_focused()
+        return key
+
+    def _prefetch_focused(self):
+        _widget, node = self.w_listbox.get_focus()
+        channel = None if node is None else node.get_value().get('channel')
+        self.chat_widget.discord.prefetcher.focus(channel)
 
     @keymaps.SERVER_TREE.command
     def close(self):
@@ -68,13 +93,22 @@ class ServerTree(urwid.WidgetWrap):
 
 class TreeWidgetChannel(urwid.TreeWidget):
     def get_display_text(self):
-        return self.get_node().get_value()['name']
+        value = self.get_node().get_value()
+        entry = value['server_tree'].unread.channels.get(value['channel'].id)
+        if entry is None:
+            return value['name']
+        return value['name'] + processing.unread_badge(entry.unread,
+                                                       entry.mentions)
 
     def load_inner_widget(self):
+        self.w_text = urwid.Text(self.get_display_text())
         return urwid.AttrMap(
-            urwid.Text(self.get_display_text()), "servtree_channel",
+            self.w_text, "servtree_channel",
             "servtree_channel_f")
 
+    def update_badge(self):
+        self.w_text.set_text(self.get_display_text())
+
     @keymaps.SERVER_TREE_CHANNEL.keypress
     def keypress(self, size, key):
         return key
@@ -116,14 +150,21 @@ class TreeWidgetServer(urwid.TreeWidget):
         urwid.WidgetWrap.__init__(self, widget)
 
     def get_display_text(self):
-        return self.get_node().get_value()['name'] + ": " + str(
-            len(self.get_node().get_value()['children']))
+        value = self.get_node().get_value()
+        counts = value['server_tree'].unread.counts(
+            ch['channel'] for ch in value['children'])
+        return value['name'] + ": " + str(
+            len(value['children'])) + processing.unread_badge(*counts)
 
     def load_inner_widget(self):
+        self.w_text = urwid.Text(self.get_display_text())
         return urwid.AttrMap(
-            urwid.Text(self.get_display_text()), "servtree_server",
+            self.w_text, "servtree_server",
             "servtree_server_f")
 
+    def update_badge(self):
+        self.w_text.set_text(self.get_display_text())
+
     @keymaps.SERVER_TREE_SERVER.keypress
     def keypress(self, size, key):
         return urwid.TreeWidget.keypress(self, size, key)
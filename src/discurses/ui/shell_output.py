@@ -0,0 +1,98 @@
+import urwid
+
+import discurses.keymaps as keymaps
+import discurses.processing
+from discurses.shell import ShellCommand
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ShellOutputWidget(urwid.WidgetWrap):
+    """
+    Streams the output of a shell command as it runs, to be inserted in the
+    message box or sent once it looks right.
+    """
+
+    # Seconds between redraws while output is streaming in
+    REDRAW_INTERVAL = 0.1
+
+    def __init__(self, chat_widget, command):
+        self.chat_widget = chat_widget
+        self.discord = chat_widget.discord
+        self.w_lines = urwid.SimpleFocusListWalker([urwid.Text("")])
+        self.w_status = urwid.Text("")
+        self._redraw_pending = False
+        self.__super.__init__(urwid.ListBox(self.w_lines))
+        self.command = ShellCommand(command, self._on_output, self._on_exit,
+                                    self.discord, scope=chat_widget)
+        self._set_status()
+        self.command.start()
+
+    def selectable(self):
+        return True
+
+    @keymaps.SHELL_OUTPUT.keypress
+    def keypress(self, size, key):
+        return self._w.keypress(size, key)
+
+    def _set_status(self):
+        hints = "esc cancel" if self.command.status == "running" else \
+            "enter insert, meta enter send, esc close"
+        self.w_status.set_text("{0} | {1} | {2}".format(
+            self.command.status,
+            discurses.processing.format_bytes(self.command.size), hints))
+
+    def _on_output(self, text):
+        lines = text.split("\n")
+        last = self.w_lines[-1]
+        last.set_text(last.text + lines[0])
+        self.w_lines.extend(urwid.Text(line) for line in lines[1:])
+        self.w_lines.set_focus(len(self.w_lines) - 1)
+        self._set_status()
+        self._schedule_redraw()
+
+    def _on_exit(self, status):
+        self._set_status()
+        self._schedule_redraw()
+
+    def _schedule_redraw(self):
+        if self._redraw_pending:
+            return
+        self._redraw_pending = True
+
+        def _redraw():
+            self._redraw_pending = False
+            self.discord.ui.draw_screen()
+
+        self.discord.loop.call_later(self.REDRAW_INTERVAL, _redraw)
+
+    @keymaps.SHELL_OUTPUT.command
+    def cancel(self):
+        if self.command.status == "running":
+            self.command.cancel()
+        else:
+            self.chat_widget.close_pop_up()
+
+    @keymaps.SHELL_OUTPUT.command
+    def insert_output(self):
+        if self.command.status == "running":
+            return
+        self.chat_widget.close_pop_up()
+        self.chat_widget.w_message_edit.edit.insert_text(
+            "```\n" + self.command.output.rstrip("\n") + "\n```")
+        self.chat_widget.set_focus('MESSAGE_EDIT')
+
+    @keymaps.SHELL_OUTPUT.command
+    def send_output(self):
+        if self.command.status == "running":
+            return
+        self.chat_widget.close_pop_up()
+        self.discord.async_do(self._send(self.chat_widget.send_channel))
+
+    async def _send(self, channel):
+        # One message per code block, in order
+        for block in discurses.processing.split_code_blocks(
+                self.command.output):
+            await self.discord.send_message(channel, block)
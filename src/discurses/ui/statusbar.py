@@ -17,26 +17,39 @@ class Statusbar(urwid.WidgetWrap):
 
         # Public widgets
         self.w_echo = urwid.Text('')
+        self.w_progress = urwid.Text('')
         self.w_typing = TypingList(self.chat)
 
         # Setup layout
         self._w_layout = urwid.AttrMap(
             urwid.Padding(
                 urwid.Columns([('pack', self.w_echo),
-                               ('weight', 1, self.w_typing)]),
+                               ('pack', self.w_progress),
+                               ('weight', 1, self.w_typing)],
+                              dividechars=1),
                 left=1, right=1),
             'statusbar')
         self.__super.__init__(self._w_layout)
 
     def echo(self, message, *args, **kwargs):
-        logger.info('Echo: ' + message, *args, **kwargs)
-        self.w_echo.set_text(message.format(*args, **kwargs))
+        message = message.format(*args, **kwargs)
+        logger.info('Echo: %s', message)
+        self.w_echo.set_text(message)
+
+    def clear(self, message=None):
+        """Clear the echo, if it is `message` when given"""
+        if message is None or self.w_echo.text == message:
+            self.w_echo.set_text('')
+
+    def set_progress(self, text):
+        self.w_progress.set_text(text)
 
 
 class TypingList(urwid.WidgetWrap):
     def __init__(self, chat_widget):
         self.chat = chat_widget
         self.typing = {}
+        self._alarm = None
         self.w_txt = urwid.Text("", align="right")
         self.chat.discord.add_event_handler("on_typing", self.on_typing)
         self.chat.discord.add_event_handler("on_message", self.on_message)
@@ -67,10 +80,16 @@ class TypingList(urwid.WidgetWrap):
             users.append(typ['user'].display_name)
         for r in rm:
             del self.typing[r]
-        if len(users) > 0:
-            self.w_txt.set_text("Typing: " + str.join(", ", users))
-        else:
-            self.w_txt.set_text("")
-        loop.set_alarm_in(0.2, self.update_typing)
+        text = "Typing: " + str.join(", ", users) if users else ""
+        if text != self.w_txt.text:
+            self.w_txt.set_text(text)
+        self._alarm = loop.set_alarm_in(
+            2 if self.chat.ui.low_bandwidth else 0.2, self.update_typing)
+
+    def stop(self):
+        """Stop refreshing"""
+        if self._alarm is not None:
+            self.chat.ui.urwid_loop.remove_alarm(self._alarm)
+            self._alarm = None
 
 
@@ -0,0 +1,107 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelUnread:
+    """Read state of a channel"""
+    __slots__ = ('last_read_id', 'last_message_id', 'unread', 'mentions')
+
+    def __init__(self):
+        self.last_read_id = None
+        self.last_message_id = None
+        self.unread = 0
+        self.mentions = 0
+
+
+class UnreadIndex:
+    """
+    Unread messages and mentions per channel id.
+
+    Seeded from the read state in READY, then kept up to date from the
+    messages that arrive, without ever fetching history. Channels that are
+    unread on startup count as one unread message, as the exact number is
+    unknown. Every change dispatches `on_unread_update` with the channel id.
+    """
+
+    def __init__(self, discord_client):
+        self.discord = discord_client
+        self.channels = {}
+
+    def get(self, channel_id):
+        entry = self.channels.get(channel_id)
+        if entry is None:
+            entry = self.channels[channel_id] = ChannelUnread()
+        return entry
+
+    def counts(self, channels):
+        """Total `(unread, mentions)` of `channels`"""
+        unread = mentions = 0
+        for ch in channels:
+            entry = self.channels.get(ch.id)
+            if entry is not None:
+                unread += entry.unread
+                mentions += entry.mentions
+        return unread, mentions
+
+    def last_read(self, channel_id):
+        entry = self.channels.get(channel_id)
+        return None if entry is None else entry.last_read_id
+
+    def seed(self, data):
+        """Seed the index from the data of the READY event"""
+        last_message_ids = {}
+        for guild in data.get('guilds', []):
+            for ch in guild.get('channels', []):
+                last_message_ids[ch.get('id')] = ch.get('last_message_id')
+        for ch in data.get('private_channels', []):
+            last_message_ids[ch.get('id')] = ch.get('last_message_id')
+        for st in data.get('read_state', []):
+            entry = self.get(st.get('id'))
+            entry.last_read_id = st.get('last_message_id')
+            entry.mentions = st.get('mention_count') or 0
+            last_id = last_message_ids.get(st.get('id'))
+            entry.last_message_id = last_id
+            read_id = entry.last_read_id
+            if last_id is not None and (read_id is None or
+                                        int(last_id) > int(read_id)):
+                entry.unread = 1
+        logger.debug("Seeded read state of %d channels", len(self.channels))
+
+    def on_message(self, message):
+        entry = self.get(message.channel.id)
+        entry.last_message_id = message.id
+        user = self.discord.client_for(message.channel).user
+        if message.author == user or \
+                message.channel in self.discord.ui.visible_channels():
+            self.mark_read(message.channel.id)
+            return
+        entry.unread += 1
+        if user in message.mentions or \
+                message.mention_everyone:
+            entry.mentions += 1
+        self._updated(message.channel.id)
+
+    def ack(self, channel_id, message_id):
+        """A message was marked as read, possibly by another client"""
+        entry = self.get(channel_id)
+        entry.last_read_id = message_id
+        if entry.last_message_id is None or \
+                int(message_id) >= int(entry.last_message_id):
+            entry.unread = 0
+            entry.mentions = 0
+        self._updated(channel_id)
+
+    def mark_read(self, channel_id):
+        entry = self.get(channel_id)
+        if entry.last_message_id is not None:
+            entry.last_read_id = entry.last_message_id
+        if entry.unread == 0 and entry.mentions == 0:
+            return
+        entry.unread = 0
+        entry.mentions = 0
+        self._updated(channel_id)
+
+    def _updated(self, channel_id):
+        for f in self.discord.event_handlers['on_unread_update']:
+            f(channel_id)
@@ -0,0 +1,151 @@
+"""Uploads of files."""
+import asyncio
+import io
+import os
+import time
+
+import discord
+
+import discurses.config as config
+from discurses.processing import format_bytes
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class UploadError(Exception):
+    pass
+
+
+class ProgressReader(io.RawIOBase):
+    """A file opened for reading that reports how much has been read"""
+
+    def __init__(self, path, callback):
+        self.file = open(path, 'rb')
+        self.callback = callback
+        self.done = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self.file.readinto(buffer)
+        self.done += n
+        self.callback(self.done)
+        return n
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+class Upload:
+    def __init__(self, owner, channel, path, content, progress):
+        self.owner = owner
+        self.channel = channel
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.size = os.path.getsize(path)
+        self.content = content
+        self.progress = progress
+        self.done = 0
+        self.started = None
+        self.reported = 0
+        self.status = "queued"
+        self.task = None
+
+    def throughput(self):
+        """Bytes per second so far"""
+        if self.started is None:
+            return 0
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed > 0 else 0
+
+    def describe(self):
+        if self.status == "uploading":
+            return "↑ {0} {1}% {2}/s".format(
+                self.filename, self.done * 100 // max(self.size, 1),
+                format_bytes(int(self.throughput())))
+        return "↑ {0} {1}".format(self.filename, self.status)
+
+
+class UploadManager:
+    """
+    Uploads files, at most `concurrency` at a time, streaming them from disk.
+
+    `progress(upload)` is called as an upload progresses, at most every
+    `interval` seconds, and when its status changes.
+    """
+
+    def __init__(self, discord_client, concurrency=None, limit=None,
+                 interval=0.25):
+        if concurrency is None:
+            concurrency = config.table.get('upload_concurrency', 2)
+        if limit is None:
+            limit = config.table.get('upload_limit', 8) * 2 ** 20
+        self.discord = discord_client
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limit = limit
+        self.interval = interval
+        self.uploads = []
+
+    def upload(self, owner, channel, path, content=None, progress=None):
+        """
+        Queue an upload of `path` to `channel`.
+        Raises UploadError if the file is too large for discord.
+        """
+        upload = Upload(owner, channel, path, content, progress)
+        if upload.size > self.limit:
+            raise UploadError("{0} is {1}, the limit is {2}".format(
+                upload.filename, format_bytes(upload.size),
+                format_bytes(self.limit)))
+        self.uploads.append(upload)
+        # Cancelled with the tab of `owner`
+        upload.task = self.discord.async_do(self._run(upload), scope=owner)
+        self._report(upload)
+        return upload
+
+    def cancel(self, owner):
+        """Cancel the latest upload of `owner`"""
+        for upload in reversed(self.uploads):
+            if upload.owner is owner:
+                upload.task.cancel()
+                return upload
+        return None
+
+    def _report(self, upload):
+        upload.reported = time.monotonic()
+        if upload.progress is not None:
+            upload.progress(upload)
+
+    def _read(self, upload, done):
+        upload.done = done
+        if time.monotonic() - upload.reported >= self.interval:
+            self._report(upload)
+
+    async def _run(self, upload):
+        try:
+            async with self.semaphore:
+                upload.status = "uploading"
+                upload.started = time.monotonic()
+                self._report(upload)
+                reader = ProgressReader(
+                    upload.path, lambda done: self._read(upload, done))
+                try:
+                    await self.discord.send_file(
+                        upload.channel, reader, filename=upload.filename,
+                        content=upload.content)
+                finally:
+                    reader.close()
+            upload.status = "done"
+            logger.info("Uploaded %s in %.1fs", upload.filename,
+                        time.monotonic() - upload.started)
+        except asyncio.CancelledError:
+            upload.status = "cancelled"
+        except (discord.HTTPException, OSError) as e:
+            logger.exception("Upload of %s failed", upload.filename)
+            upload.status = "failed: {0}".format(e)
+        finally:
+            self.uploads.remove(upload)
+            self._report(upload)
@@ -0,0 +1,79 @@
+"""The width of text in terminal cells."""
+import functools
+import re
+import unicodedata
+
+ZERO_WIDTH_JOINER = "\u200d"
+EMOJI_PRESENTATION = "\ufe0f"
+SKIN_TONES = ("\U0001f3fb", "\U0001f3ff")
+
+_PRINTABLE_ASCII = re.compile(r"[ -~]*\Z")
+
+# Block of 256 code points -> the widths of its code points, as bytes
+_blocks = {}
+
+
+def _code_point_width(code_point):
+    c = chr(code_point)
+    if unicodedata.combining(c) or \
+            unicodedata.category(c) in ("Mn", "Me", "Cf", "Cc"):
+        return 0
+    # Emoji presented as emoji are wide since unicode 9
+    if unicodedata.east_asian_width(c) in ("W", "F"):
+        return 2
+    return 1
+
+
+def char_width(c):
+    """The width of a character on its own"""
+    code_point = ord(c)
+    block = _blocks.get(code_point >> 8)
+    if block is None:
+        start = code_point & ~0xff
+        block = _blocks[code_point >> 8] = bytes(
+            _code_point_width(i) for i in range(start, start + 256))
+    return block[code_point & 0xff]
+
+
+def _widths(text):
+    """The width of every character of `text`, in context"""
+    widths = []
+    joined = False
+    for c in text:
+        if joined:
+            # Part of an emoji joined to the previous one
+            w = 0
+        elif c == EMOJI_PRESENTATION and widths:
+            widths[-1] = 2
+            w = 0
+        elif SKIN_TONES[0] <= c <= SKIN_TONES[1] and widths and \
+                widths[-1] == 2:
+            w = 0
+        else:
+            w = char_width(c)
+        joined = c == ZERO_WIDTH_JOINER
+        widths.append(w)
+    return widths
+
+
+@functools.lru_cache(maxsize=4096)
+def cell_width(text):
+    """The number of cells `text` takes up on a terminal"""
+    if _PRINTABLE_ASCII.match(text):
+        return len(text)
+    return sum(_widths(text))
+
+
+@functools.lru_cache(maxsize=4096)
+def truncate(text, cells):
+    """`text` cut to at most `cells` cells, never through a character"""
+    if cell_width(text) <= cells:
+        return text
+    if _PRINTABLE_ASCII.match(text):
+        return text[:max(0, cells)]
+    total = 0
+    for index, w in enumerate(_widths(text)):
+        if total + w > cells:
+            return text[:index]
+        total += w
+    return text
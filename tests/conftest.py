@@ -0,0 +1,79 @@
+import asyncio
+import gzip
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+# discurses.config reads ~/.config/discurses.yaml when imported
+HOME = tempfile.mkdtemp()
+os.makedirs(os.path.join(HOME, ".config"))
+with open(os.path.join(HOME, ".config", "discurses.yaml"), "w") as f:
+    f.write("token: TEST\nnotify: False\n")
+os.environ['HOME'] = HOME
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    """
+    A FakeDiscord without generated traffic, on an event loop of its own,
+    which discord.py is pointed at
+    """
+    from discord.http import Route
+    from discurses.fakeserver import FakeDiscord
+    loop = asyncio.new_event_loop()
+    server = FakeDiscord(port=0, guilds=2, members=20, channels=2, rate=0,
+                         typing_rate=0, presence_rate=0, loop=loop)
+    loop.run_until_complete(server.start())
+    monkeypatch.setattr(Route, 'BASE',
+                        "http://127.0.0.1:{0}/api/v7".format(server.port))
+    yield server
+    server.server.close()
+    loop.close()
+
+
+def write_snapshot(server):
+    """A snapshot of two tabs showing the channels of the first guild"""
+    from discurses import snapshot
+    guild = server.guilds[0]
+    channel_ids = [ch['id'] for ch in guild['channels']]
+    tabs = [{'index': index, 'name': str(index), 'channels': channel_ids,
+             'send_channel': channel_ids[0], 'cursor': None,
+             'show_member_list': True, 'show_server_tree': True}
+            for index in (0, 1)]
+    data = {
+        'version': snapshot.SNAPSHOT_VERSION,
+        'current_tab': 0,
+        'tabs': tabs,
+        'servers': [{'id': guild['id'], 'name': guild['name'],
+                     'channels': [[ch['id'], ch['name'], ch['type']]
+                                  for ch in guild['channels']]}],
+        'private_channels': [],
+    }
+    with gzip.open(snapshot.SNAPSHOT_PATH, 'wt', encoding='utf-8') as file:
+        json.dump(data, file)
+
+
+@pytest.fixture
+def warm_client(fake_server):
+    """
+    A headless DiscordClient, not logged in yet, warm started with two
+    tabs showing the channels of the first guild of the fake server
+    """
+    from discurses.discord import DiscordClient
+    from discurses.ui.headless import HeadlessScreen
+    write_snapshot(fake_server)
+    client = DiscordClient(screen=HeadlessScreen(), loop=fake_server.loop)
+    yield client
+    tasks = list(client.tasks.tasks.values())
+    for task in tasks:
+        task.cancel()
+    fake_server.loop.run_until_complete(asyncio.gather(
+        *tasks, loop=fake_server.loop, return_exceptions=True))
+    client.ui.urwid_loop.stop()
+    client.media.close()
+    fake_server.loop.run_until_complete(client.http.close())
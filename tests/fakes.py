@@ -0,0 +1,25 @@
+"""Just enough of the discord objects for the tests"""
+
+
+class User:
+    def __init__(self, id):
+        self.id = id
+        self.name = self.display_name = "user" + id
+
+
+class Channel:
+    def __init__(self, id, is_private=False):
+        self.id = id
+        self.is_private = is_private
+
+
+class Message:
+    def __init__(self, id, channel, content="hi", attachments=()):
+        self.id = str(id)
+        self.channel = channel
+        self.author = User("2")
+        self.content = content
+        self.mentions = []
+        self.channel_mentions = []
+        self.role_mentions = []
+        self.attachments = list(attachments)
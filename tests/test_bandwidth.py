@@ -0,0 +1,60 @@
+import asyncio
+
+import urwid
+
+from discurses.discord import DiscordClient
+from discurses.ui.bandwidth import OutputMeter
+from discurses.ui.headless import HeadlessScreen
+
+
+class TerminalScreen(HeadlessScreen):
+    """A headless screen that writes what it draws"""
+
+    def __init__(self):
+        super().__init__()
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+    def draw_screen(self, size, canvas):
+        super().draw_screen(size, canvas)
+        self.write("héllo")
+
+
+def canvas():
+    return urwid.Text("hello").render((10,))
+
+
+def test_counts_draws_of_a_headless_screen():
+    meter = OutputMeter()
+    screen = HeadlessScreen()
+    meter.attach(screen)
+    screen.draw_screen((10, 1), canvas())
+    assert meter.draws == 1
+    assert meter.bytes == 0
+    assert screen.frames == 1
+
+
+def test_counts_bytes_written():
+    meter = OutputMeter()
+    screen = TerminalScreen()
+    meter.attach(screen)
+    screen.draw_screen((10, 1), canvas())
+    assert meter.draws == 1
+    assert meter.bytes == 6
+
+
+def test_headless_ui_counts_draws():
+    loop = asyncio.new_event_loop()
+    client = DiscordClient(screen=HeadlessScreen(), loop=loop,
+                           warm_start=False)
+    try:
+        client.ui.urwid_loop.draw_screen()
+        client.ui.urwid_loop.draw_screen()
+        assert client.ui.output.draws == 2
+    finally:
+        client.ui.urwid_loop.stop()
+        client.media.close()
+        loop.run_until_complete(client.http.close())
+        loop.close()
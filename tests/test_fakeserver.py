@@ -0,0 +1,55 @@
+import asyncio
+import datetime
+
+import discord
+from discord.utils import snowflake_time, time_snowflake
+
+
+def run_client(server, ready):
+    """
+    Log a discord.Client in against `server`, and return what the
+    coroutine function `ready` returns once it is ready
+    """
+    client = discord.Client(loop=server.loop)
+    result = {}
+
+    @client.event
+    async def on_ready():
+        try:
+            result['value'] = await ready(client)
+        finally:
+            await client.logout()
+
+    # Without answers to member requests, ready takes 30s a guild
+    server.loop.run_until_complete(asyncio.wait_for(
+        client.start("TOKEN", bot=False), 15, loop=server.loop))
+    return result['value']
+
+
+def test_login(fake_server):
+    async def ready(client):
+        return client.user.name, [len(s.members) for s in client.servers]
+
+    name, members = run_client(fake_server, ready)
+    assert name == "discurses"
+    assert members == [21, 21]
+
+
+def test_history_after_and_around(fake_server):
+    start = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+    mark = discord.Object(id=str(time_snowflake(start)))
+
+    async def ready(client):
+        channel = next(iter(next(iter(client.servers)).channels))
+        after = [m async for m in
+                 client.logs_from(channel, limit=10, after=mark)]
+        around = [m async for m in
+                  client.logs_from(channel, limit=10, around=mark)]
+        return after, around
+
+    after, around = run_client(fake_server, ready)
+    assert len(after) == 10
+    assert all(snowflake_time(m.id) > start for m in after)
+    assert len(around) == 10
+    assert any(snowflake_time(m.id) < start for m in around)
+    assert any(snowflake_time(m.id) > start for m in around)
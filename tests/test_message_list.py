@@ -0,0 +1,57 @@
+import asyncio
+
+from discurses.tasks import Priority
+
+
+def history_client(client):
+    """
+    Make `client` serve history from a fake, and return the ids of the
+    channels asked for. Only the first request hangs.
+    """
+    requests = []
+
+    async def get_logs_from(channel, limit, before=None):
+        requests.append(channel.id)
+        if len(requests) == 1:
+            await asyncio.Future(loop=client.loop)
+        return []
+
+    client.received_ready = True
+    client.get_logs_from = get_logs_from
+    return requests
+
+
+def run_briefly(loop):
+    loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+
+
+def test_interactive_fetch_takes_over_background_fetch(warm_client):
+    client = warm_client
+    requests = history_client(client)
+    tab = client.ui.tabs[0]
+    walker = tab.w_message_list.list_walker
+    channel = tab.channels[0]
+    walker.get_logs(channels=[channel], priority=Priority.BACKGROUND)
+    run_briefly(client.loop)
+    background = client.tasks.tasks[(tab, "history " + channel.id)]
+    # As when the top of the list is scrolled to
+    walker.get_logs(channels=[channel])
+    run_briefly(client.loop)
+    assert background.cancelled()
+    assert requests == [channel.id, channel.id]
+    assert channel.id not in walker.polling
+    assert channel.id in walker.exhausted
+
+
+def test_fetches_are_not_duplicated(warm_client):
+    client = warm_client
+    requests = history_client(client)
+    tab = client.ui.tabs[0]
+    walker = tab.w_message_list.list_walker
+    channel = tab.channels[0]
+    walker.get_logs(channels=[channel])
+    walker.get_logs(channels=[channel])
+    walker.get_logs(channels=[channel], priority=Priority.BACKGROUND)
+    run_briefly(client.loop)
+    assert requests == [channel.id]
+    assert channel.id in walker.polling
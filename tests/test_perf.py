@@ -0,0 +1,13 @@
+from discurses.perf import percentile, record_memory
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile([3, 1, 2], 100) == 3
+
+
+def test_record_memory():
+    result = record_memory(100)
+    assert result['messages'] == 100
+    assert result['bytes_per_record'] > 0
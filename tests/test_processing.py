@@ -0,0 +1,27 @@
+from discurses.processing import clip_markup
+
+
+def test_clip_markup_short_text_is_not_clipped():
+    assert clip_markup("one\ntwo", 2, 100) is None
+
+
+def test_clip_markup_keeps_the_first_lines():
+    assert clip_markup("one\ntwo\nthree\nfour", 2, 100) == (["one\ntwo"], 2)
+
+
+def test_clip_markup_cuts_long_lines():
+    assert clip_markup("abcdefghij", 5, 4) == (["abcd"], 0)
+
+
+def test_clip_markup_keeps_attributes():
+    markup = ["hi ", ('message_mention_self', "you"), "\nthere\nand more"]
+    head, left_out = clip_markup(markup, 1, 100)
+    assert head == ["hi ", ('message_mention_self', "you")]
+    assert left_out == 2
+
+
+def test_clip_markup_cuts_inside_an_attribute():
+    markup = ["hi ", ('message_mention_self', "everyone")]
+    head, left_out = clip_markup(markup, 5, 5)
+    assert head == ["hi ", ('message_mention_self', "ev")]
+    assert left_out == 0
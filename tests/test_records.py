@@ -0,0 +1,31 @@
+import re
+
+from discurses.records import MessageRecord
+from fakes import Channel, Message
+
+
+ID = 300000000000000000
+CHANNEL = Channel("1", is_private=True)
+ATTACHMENT = {'id': "5", 'filename': "cat.png", 'size': 3,
+              'url': "https://cdn.example/cat.png"}
+
+
+def test_markup_shows_attachment_urls():
+    record = MessageRecord.from_message(
+        Message(ID, CHANNEL, "look", [ATTACHMENT]), "1")
+    assert "https://cdn.example/cat.png" in "".join(
+        part if isinstance(part, str) else part[1]
+        for part in record.markup)
+
+
+def test_clean_content_leaves_out_attachment_urls():
+    record = MessageRecord.from_message(
+        Message(ID, CHANNEL, "look", [ATTACHMENT]), "1")
+    assert record.clean_content == "look"
+
+
+def test_clean_content_resolves_highlights():
+    record = MessageRecord.from_message(
+        Message(ID, CHANNEL, "hello world"), "1", re.compile("world"))
+    assert not isinstance(record.markup, str)
+    assert record.clean_content == "hello world"
@@ -0,0 +1,204 @@
+import collections
+
+import pytest
+
+from discurses.store import MessageStore
+from fakes import Channel, Message, User
+
+
+class Rules:
+    matcher = None
+
+
+class Client:
+    def __init__(self):
+        self.user = User("1")
+        self.rules = Rules()
+        self.event_handlers = collections.defaultdict(list)
+        # Ids of the channels another account dispatches
+        self.elsewhere = set()
+
+    def add_event_handler(self, event, f):
+        self.event_handlers[event].append(f)
+
+    def client_for(self, channel):
+        return self
+
+    def dispatches(self, channel):
+        return channel.id not in self.elsewhere
+
+    def get_channel(self, id):
+        return Channel(id)
+
+    def dispatch(self, event, *args):
+        for f in self.event_handlers[event]:
+            f(*args)
+
+
+class View:
+    def __init__(self):
+        self.added = []
+        self.edited = []
+        self.deleted = []
+
+    def message_added(self, record):
+        self.added.append(record.id)
+
+    def message_edited(self, record):
+        self.edited.append(record.id)
+
+    def message_deleted(self, record):
+        self.deleted.append(record.id)
+
+
+@pytest.fixture
+def client():
+    return Client()
+
+
+@pytest.fixture
+def store(client):
+    return MessageStore(client, max_channels=2)
+
+
+CHANNEL = Channel("10")
+
+
+def messages(ids, channel=CHANNEL):
+    """Messages of `ids`, newest first as they are requested"""
+    return [Message(i, channel) for i in sorted(ids, reverse=True)]
+
+
+def ids(records):
+    return [r.id for r in records]
+
+
+def test_page_needs_request_until_added(store):
+    assert store.page("10", None, 10) is None
+    assert "10" not in store
+
+
+def test_latest_page_is_served(store):
+    store.add_page("10", None, messages(range(100, 110)), False)
+    assert "10" in store
+    records, exhausted = store.page("10", None, 5)
+    assert ids(records) == [109, 108, 107, 106, 105]
+    assert not exhausted
+    records, exhausted = store.page("10", 105, 10)
+    assert ids(records) == [104, 103, 102, 101, 100]
+    assert not exhausted
+    # Older than what is known
+    assert store.page("10", 100, 10) is None
+
+
+def test_exhausted_history(store):
+    store.add_page("10", None, messages(range(100, 105)), True)
+    records, exhausted = store.page("10", None, 10)
+    assert ids(records) == [104, 103, 102, 101, 100]
+    assert exhausted
+    assert store.page("10", 100, 10) == ([], True)
+
+
+def test_older_page_extends_contiguous_history(store):
+    store.add_page("10", None, messages(range(105, 110)), False)
+    store.add_page("10", 105, messages(range(100, 105)), True)
+    records, exhausted = store.page("10", None, 20)
+    assert ids(records) == list(range(109, 99, -1))
+    assert exhausted
+
+
+def test_detached_page_is_not_contiguous(store):
+    # Around a message jumped to, far from the latest ones
+    store.add_page("10", 50, messages(range(40, 50)), False)
+    assert "10" not in store
+    assert store.page("10", None, 10) is None
+    store.add_page("10", None, messages(range(100, 105)), False)
+    records, _ = store.page("10", None, 20)
+    assert ids(records) == [104, 103, 102, 101, 100]
+    assert store.page("10", 100, 10) is None
+
+
+def test_records_are_shared(store):
+    first = store.add_page("10", None, messages([100]), False)
+    second = store.add(messages([100]))
+    assert first[0] is second[0]
+
+
+def test_events_reach_views(client, store):
+    view = View()
+    store.acquire("10", view)
+    store.add_page("10", None, messages([100]), False)
+    client.dispatch('on_message', Message(101, CHANNEL))
+    client.dispatch('on_message_edit', Message(101, CHANNEL),
+                    Message(101, CHANNEL, "edited"))
+    client.dispatch('on_message_delete', Message(100, CHANNEL))
+    assert view.added == [101]
+    assert view.edited == [101]
+    assert view.deleted == [100]
+    records, _ = store.page("10", None, 10)
+    assert [r.content for r in records] == ["edited"]
+
+
+def test_release_trims_to_latest(store):
+    view = View()
+    store.acquire("10", view)
+    store.add_page("10", None, messages(range(100, 200)), True)
+    store.release("10", view)
+    records, exhausted = store.page("10", None, 100)
+    assert ids(records) == list(range(199, 199 - store.KEEP, -1))
+    assert not exhausted
+
+
+def test_unviewed_channel_stays_trimmed(client, store):
+    store.add_page("10", None, messages(range(100, 110)), False)
+    for i in range(110, 110 + 2 * store.KEEP):
+        client.dispatch('on_message', Message(i, CHANNEL))
+    history = store.channels["10"]
+    assert len(history.records) == store.KEEP
+    records, _ = store.page("10", None, 2 * store.KEEP)
+    assert records[0].id == 110 + 2 * store.KEEP - 1
+    assert len(records) == store.KEEP
+
+
+def test_unviewed_detached_channel_ignores_messages(client, store):
+    store.add_page("10", 50, messages(range(40, 50)), False)
+    client.dispatch('on_message', Message(100, CHANNEL))
+    assert 100 not in store.channels["10"].records
+
+
+def test_unused_channels_are_evicted(store):
+    for channel_id in ("1", "2", "3"):
+        store.add_page(channel_id, None,
+                       messages([100], Channel(channel_id)), False)
+    assert "1" not in store
+    assert "2" in store and "3" in store
+
+
+def test_viewed_channels_are_not_evicted(store):
+    view = View()
+    store.acquire("1", view)
+    for channel_id in ("1", "2", "3", "4"):
+        store.add_page(channel_id, None,
+                       messages([100], Channel(channel_id)), False)
+    assert "1" in store
+    assert "2" not in store
+
+
+def test_resume_drops_unviewed_and_refreshes_viewed(client, store):
+    view = View()
+    store.acquire("1", view)
+    store.add_page("1", None, messages([100], Channel("1")), False)
+    store.add_page("2", None, messages([100], Channel("2")), False)
+    client.dispatch('on_resumed', client)
+    assert "2" not in store.channels
+    assert "1" not in store
+    assert 100 in store.channels["1"].records
+
+
+def test_resume_keeps_channels_of_other_accounts(client, store):
+    store.add_page("1", None, messages([100], Channel("1")), False)
+    store.add_page("2", None, messages([100], Channel("2")), False)
+    client.elsewhere.add("2")
+    client.dispatch('on_resumed', client)
+    assert "1" not in store.channels
+    assert "2" in store
@@ -0,0 +1,29 @@
+import asyncio
+
+import discord
+
+from discurses.ui import ChatWindow
+
+
+def test_reconcile_with_server_tree_focused(warm_client):
+    client = warm_client
+    loop = client.loop
+    tab = client.ui.tabs[0]
+    assert isinstance(tab, ChatWindow)
+    assert tab._w_columns.focus is tab._w_server_tree_column
+
+    async def session():
+        running = loop.create_task(client.start())
+        while not client.received_ready:
+            await asyncio.sleep(0.05)
+        await client.logout()
+        await running
+
+    loop.run_until_complete(asyncio.wait_for(session(), 15, loop=loop))
+    assert tab._w_columns.focus is tab._w_server_tree_column
+    assert tab._w_server_tree_column.original_widget is tab.w_server_tree
+    # Every tab is reconciled, not only the first
+    for tab in client.ui.tabs.values():
+        assert len(tab.channels) == 2
+        assert all(isinstance(ch, discord.Channel) for ch in tab.channels)
+        assert isinstance(tab.send_channel, discord.Channel)
@@ -0,0 +1,28 @@
+from discurses.width import cell_width, truncate
+
+
+def test_cell_width():
+    assert cell_width("abc") == 3
+    assert cell_width("日本") == 4
+    assert cell_width("é") == 1
+
+
+def test_truncate_ascii():
+    assert truncate("abcdef", 3) == "abc"
+    assert truncate("abc", 5) == "abc"
+    assert truncate("abc", -1) == ""
+
+
+def test_truncate_never_splits_wide_characters():
+    assert truncate("日本語", 3) == "日"
+    assert truncate("日本語", 4) == "日本"
+
+
+def test_truncate_keeps_combining_characters():
+    assert truncate("éé", 1) == "é"
+
+
+def test_truncate_keeps_emoji_presentation():
+    assert cell_width("❤️") == 2
+    assert truncate("❤️a", 1) == ""
+    assert truncate("❤️a", 2) == "❤️"